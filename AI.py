@@ -1,82 +1,267 @@
+import multiprocessing
+import os
 import random
-from Engine import Move
-
-pawnScores = ((8, 8, 8, 8, 8, 8, 8, 8),
-              (8, 8, 8, 8, 8, 8, 8, 8),
-              (5, 6, 6, 7, 7, 6, 6, 5),
-              (2, 3, 3, 5, 5, 3, 3, 2),
-              (1, 2, 2, 4, 4, 2, 2, 1),
-              (1, 1, 2, 3, 3, 2, 1, 1),
-              (1, 1, 1, 0, 0, 1, 1, 1),
-              (0, 0, 0, 0, 0, 0, 0, 0))
-
-knightScores = ((1, 1, 1, 1, 1, 1, 1, 1),
-                (1, 2, 2, 2, 2, 2, 2, 1),
-                (1, 2, 3, 3, 3, 3, 2, 1),
-                (1, 2, 3, 4, 4, 3, 2, 1),
-                (1, 2, 3, 4, 4, 3, 2, 1),
-                (1, 2, 3, 3, 3, 3, 2, 1),
-                (1, 2, 2, 2, 2, 2, 2, 1),
-                (1, 1, 1, 1, 1, 1, 1, 1))
-
-bishopScores = ((4, 3, 2, 1, 1, 2, 3, 4),
-                (3, 4, 3, 2, 2, 3, 4, 3),
-                (2, 3, 4, 3, 3, 4, 3, 2),
-                (1, 2, 3, 4, 4, 3, 2, 1),
-                (1, 2, 3, 4, 4, 3, 2, 1),
-                (2, 3, 4, 3, 3, 4, 3, 2),
-                (3, 4, 3, 2, 2, 3, 4, 3),
-                (4, 3, 2, 1, 1, 2, 3, 4))
-
-rookScores = ((4, 3, 4, 4, 4, 4, 3, 4),
-              (4, 4, 4, 4, 4, 4, 4, 4),
-              (1, 1, 2, 3, 3, 2, 1, 1),
-              (1, 2, 3, 4, 4, 3, 1, 1),
-              (1, 2, 3, 4, 4, 3, 1, 1),
-              (1, 1, 2, 3, 3, 2, 1, 1),
-              (4, 4, 4, 4, 4, 4, 4, 4),
-              (4, 3, 4, 4, 4, 4, 3, 4))
-
-queenScores = ((1, 1, 1, 3, 1, 1, 1, 1),
-               (1, 2, 3, 3, 3, 1, 1, 1),
-               (1, 4, 3, 3, 3, 4, 2, 1),
-               (1, 2, 3, 3, 3, 2, 2, 1),
-               (1, 2, 3, 3, 3, 2, 2, 1),
-               (1, 4, 3, 3, 3, 4, 2, 1),
-               (1, 2, 3, 3, 3, 1, 1, 1),
-               (1, 1, 1, 3, 1, 1, 1, 1))
-
-kingScores = ((1, 1, 1, 1, 1, 1, 1, 1),
-              (1, 1, 1, 1, 1, 1, 1, 1),
-              (1, 1, 1, 1, 1, 1, 1, 1),
-              (1, 1, 1, 1, 1, 1, 1, 1),
-              (2, 1, 1, 1, 1, 1, 1, 2),
-              (2, 2, 1, 1, 1, 1, 2, 2),
-              (2, 2, 1, 1, 1, 1, 2, 2),
-              (3, 4, 3, 2, 2, 3, 4, 3))
-
-pieceValue = {"K": (0, kingScores), "Q": (9, queenScores), "R": (5, rookScores), "B": (3, bishopScores), "N": (3, knightScores), "P": (1, pawnScores)}
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from operator import itemgetter
+from Book import OpeningBook
+from Tablebase import Tablebases
+from Engine import Move, PIECE_VALUES, SQUARES, MOVE_CAPTURE, MOVE_EN_PASSANT, MOVE_PROMOTION, decodeMove
 
 CHECKMATE = 10000
 STALEMATE = 0
 
-MAX_DEPTH = 4
+MATE_SCORES = 1000  # Scores this close to CHECKMATE are forced mates, CHECKMATE - n for a mate in n plies from the root
 
-global count
+MAX_DEPTH = 8
+TIME_LIMIT = 3  # Seconds findAIMove may spend on a move
 
+NODES_BETWEEN_CLOCK_CHECKS = 256  # Must be a power of two
+STOP_CHECK_INTERVAL = 0.05  # Seconds between the checks of parallelSearch for searchStop while its workers search
 
-def scoreMaterial(game_state, white=False, black=False):
-    whiteScore = blackScore = 0
+# Bound types of the scores stored in the transposition table
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+TABLE_SIZE = 1 << 20  # Number of transposition table slots, must be a power of two
+
+# Move ordering: the hash move is tried first, then captures and promotions, then killer moves, then the other quiet moves by history score
+HASH_MOVE_SCORE = 4 << 40
+CAPTURE_SCORE = 3 << 40
+KILLER_SCORE = (2 << 40, 1 << 40)  # For the first and the second killer move of a ply
+
+MAX_PLY = 64
+
+# Selective search: null move pruning and late move reductions are only tried with at least REDUCTION_MIN_DEPTH plies left, and never in check
+REDUCTION_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2  # The search after a null move is this many plies shallower than that after a move
+NULL_MOVE_MATERIAL = PIECE_VALUES["wB"]  # Material besides pawns the side to move needs for a null move, as zugzwang is common with less
+LATE_MOVE_NUMBER = 4  # Quiet moves from this one on are searched a ply shallower, and again at full depth if they turn out better than alpha
+
+NULL_WINDOW = 0.01  # Width of zero window searches, smaller than the difference between any two scores
+
+ASPIRATION_WINDOW = 0.5  # Each iteration is first searched with a window this far on either side of the score of the previous one
+
+TABLEBASE_MATERIAL = PIECE_VALUES["wQ"]  # Positions with at most this much material may be in the endgame tablebases
+
+BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")  # Built with Book.py. Without it, every move is searched
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when its time or node budget has run out, or when it has been stopped with searchStop."""
+
+
+class TranspositionTable:
+    """Fixed-size hash table of searched positions, indexed by the low bits of the Zobrist hash.
+
+    Each slot holds a single (hash, depth, bound, score, best move) tuple. A slot is overwritten when the new entry is for the same position or was searched at least as deep."""
+
+    def __init__(self, size=TABLE_SIZE):
+        self.mask = size - 1
+        self.entries = [None] * size
+
+    def probe(self, key):
+        entry = self.entries[key & self.mask]
+
+        if entry is not None and entry[0] == key:
+            return entry
+
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        index = key & self.mask
+        entry = self.entries[index]
+
+        if entry is None or entry[0] == key or depth >= entry[1]:
+            self.entries[index] = (key, depth, bound, score, move)
+
+    def clear(self):
+        self.entries = [None] * len(self.entries)
+
+
+def scoreToTable(score, ply):
+    """The score of a position searched ply plies from the root as the transposition table keeps it: mates counted from the position itself, which other searches may reach at another ply."""
+
+    if score > CHECKMATE - MATE_SCORES:
+        return score + ply
+    elif score < MATE_SCORES - CHECKMATE:
+        return score - ply
+
+    return score
+
+
+def scoreFromTable(score, ply):
+    """The inverse of scoreToTable."""
+
+    if score > CHECKMATE - MATE_SCORES:
+        return score - ply
+    elif score < MATE_SCORES - CHECKMATE:
+        return score + ply
+
+    return score
+
+
+class SearchStats:
+    """Statistics of a search, returned by findAIMove along with its move. The search functions update the SearchStats of the running search, searchStats."""
+
+    COUNTERS = ("nodes", "quiescenceNodes", "leafEvaluations", "betaCutoffs", "firstMoveCutoffs", "tableProbes", "tableHits", "tablebaseHits", "nullMoveCutoffs", "reductions", "researches",
+                "aspirationResearches")
+
+    def __init__(self):
+        self.move = None  # Best move of the deepest fully searched iteration, as (start, end)
+        self.score = None  # Its score, from the point of view of the side to move
+        self.pv = []  # Principal variation: the moves both sides are expected to play from the position, as packed moves, the first being move
+        self.depth = 0
+        self.book = False  # Whether the move was taken from the opening book
+
+        self.nodes = 0  # Positions searched, those of the quiescence search included
+        self.quiescenceNodes = 0
+        self.leafEvaluations = 0  # Calls of scoreBoard
+        self.betaCutoffs = 0  # Of negaMaxAlphaBeta, with the number of those caused by the first move searched
+        self.firstMoveCutoffs = 0
+        self.tableProbes = 0  # Of the transposition table
+        self.tableHits = 0
+        self.tablebaseHits = 0
+        self.nullMoveCutoffs = 0
+        self.reductions = 0  # Late moves searched with a reduced depth, with the number of those searched again at full depth
+        self.researches = 0
+        self.aspirationResearches = 0  # Iterations searched again, as their score fell outside the aspiration window
+
+        self.iterations = []  # (depth, nodes, seconds) of every fully searched iteration
+        self.start = self.iterationStart = time.perf_counter()
+        self.iterationNodes = 0  # nodes when the current iteration started
+        self.elapsed = 0.0
+
+    @property
+    def nodesPerSecond(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def firstMoveCutoffRate(self):
+        """Share of the beta cutoffs caused by the first move searched, the higher the better the move ordering."""
+
+        return self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0.0
+
+    @property
+    def tableHitRate(self):
+        return self.tableHits / self.tableProbes if self.tableProbes else 0.0
+
+    @property
+    def branchingFactor(self):
+        """Effective branching factor: the nodes of the last iteration over those of the one before, or None."""
+
+        if len(self.iterations) < 2 or not self.iterations[-2][1]:
+            return None
+
+        return self.iterations[-1][1] / self.iterations[-2][1]
+
+    def addIteration(self, depth, move, score, pv=()):
+        """Record a fully searched iteration and its result."""
+
+        now = time.perf_counter()
+
+        self.iterations.append((depth, self.nodes - self.iterationNodes, now - self.iterationStart))
+        self.iterationStart, self.iterationNodes = now, self.nodes
+
+        self.move, self.score, self.depth, self.pv = move, score, depth, list(pv)
+        self.elapsed = now - self.start
+
+    def addCounters(self, other):
+        """Add the counters of another search, such as that of a worker of parallelSearch."""
+
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.start
+
+    def __str__(self):
+        if self.book:
+            return "Book move"
+
+        branchingFactor = "-" if self.branchingFactor is None else f"{self.branchingFactor:.1f}"
+
+        return (f"Depth {self.depth}, score {self.score}, {self.nodes} nodes ({self.quiescenceNodes} quiescence) in {self.elapsed:.2f} s, {self.nodesPerSecond:.0f} nodes/s, "
+                f"{self.leafEvaluations} evaluations, {self.betaCutoffs} beta cutoffs ({self.firstMoveCutoffRate:.0%} first move), "
+                f"{self.nullMoveCutoffs} null move cutoffs, {self.reductions} reductions ({self.researches} searched again), {self.aspirationResearches} aspiration re-searches, "
+                f"table hits {self.tableHits}/{self.tableProbes}, tablebase hits {self.tablebaseHits}, branching factor {branchingFactor}")
+
+
+transpositionTable = TranspositionTable()
+searchStats = SearchStats()
+
+rootDepth = MAX_DEPTH
+searchDeadline = None  # perf_counter() time at which the running search has to stop, or None
+searchStop = threading.Event()  # Set from another thread to abort the running search as soon as possible
+searchNodeLimit = None  # Number of nodes after which the running search has to stop, or None
+
+openingBook = None  # OpeningBook of BOOK_FILE, opened on first use
+tablebases = Tablebases()  # Generated with Tablebase.py. The search probes whichever tables exist
+
+positionalWeight = 0.1  # Weight of the piece-square scores against material in scoreBoard
+
+killerMoves = [[None, None] for _ in range(MAX_PLY)]  # The last two quiet moves that caused a beta cutoff at each ply
+historyScores = {}  # Packed move -> how often, and how deep, the quiet move caused a beta cutoff
+
+
+def resetMoveOrdering():
+    for killers in killerMoves:
+        killers[0] = killers[1] = None
 
-    for position in game_state.whitePieces:
-        whiteScore += pieceValue[game_state.board[position[0]][position[1]][1]]
+    historyScores.clear()
+
+
+def orderMoves(game_state, moves, hashMove, ply):
+    """Sort the packed moves of Game.getMoveCodes in the order in which the search should try them."""
+
+    board = game_state.board
+    enemy = "b" if game_state.whiteToMove else "w"
+    killers = killerMoves[ply]
+
+    scoredMoves = []
+
+    for move in moves:
+        if move == hashMove:
+            score = HASH_MOVE_SCORE
+        elif move & MOVE_CAPTURE:  # Most valuable victim, least valuable attacker
+            start, end = SQUARES[move & 63], SQUARES[move >> 6 & 63]
+            score = CAPTURE_SCORE + 10 * PIECE_VALUES[board[end[0]][end[1]]] - PIECE_VALUES[board[start[0]][start[1]]]
+        elif move & MOVE_PROMOTION:
+            score = CAPTURE_SCORE + 10 * (PIECE_VALUES[enemy + "Q"] - PIECE_VALUES[enemy + "P"])
+        elif move & MOVE_EN_PASSANT:
+            score = CAPTURE_SCORE + 9 * PIECE_VALUES[enemy + "P"]
+        elif move == killers[0]:
+            score = KILLER_SCORE[0]
+        elif move == killers[1]:
+            score = KILLER_SCORE[1]
+        else:
+            score = historyScores.get(move, 0)
+
+        scoredMoves.append((score, move))
+
+    scoredMoves.sort(key=itemgetter(0), reverse=True)
+
+    return [move for score, move in scoredMoves]
+
+
+def storeCutoff(move, depth, ply):
+    """Remember a quiet move that caused a beta cutoff as a killer move of the ply, and raise its history score."""
+
+    killers = killerMoves[ply]
+
+    if move != killers[0]:
+        killers[1] = killers[0]
+        killers[0] = move
+
+    historyScores[move] = historyScores.get(move, 0) + depth * depth
+
+
+def scoreMaterial(game_state, white=False, black=False):
+    whiteScore, blackScore = game_state.material["w"], game_state.material["b"]
 
     if white:
         return whiteScore
 
-    for position in game_state.blackPieces:
-        blackScore += pieceValue[game_state.board[position[0]][position[1]][1]]
-
     if black:
         return blackScore
 
@@ -89,34 +274,297 @@ def scoreMaterial(game_state, white=False, black=False):
 
 
 def scoreBoard(game_state):
+    searchStats.leafEvaluations += 1
+
     if game_state.checkmate:
         return -CHECKMATE if game_state.whiteToMove else CHECKMATE
     elif game_state.stalemate:
         return STALEMATE
 
-    score = 0
-    for position in game_state.whitePieces:
-        piece = game_state.board[position[0]][position[1]][1]
-        score += pieceValue[piece][0] + pieceValue[piece][1][position[0]][position[1]] / 10
+    # Material and piece-square scores are kept up to date by Game.makeMove and Game.undoMove
+    return game_state.material["w"] - game_state.material["b"] + game_state.positionalScore * positionalWeight
 
-    for position in game_state.blackPieces:
-        piece = game_state.board[position[0]][position[1]][1]
-        score -= pieceValue[piece][0] + pieceValue[piece][1][::-1][position[0]][position[1]] / 10
 
-    return score
+def probeTablebases(game_state, ply):
+    """The exact score of the position, ply plies from the root, for the side to move from the endgame tablebases, or None. Shorter mates score higher."""
+
+    if game_state.material["w"] + game_state.material["b"] > TABLEBASE_MATERIAL:
+        return None
+
+    value = tablebases.probe(game_state)
+
+    if value is None:
+        return None
+
+    searchStats.tablebaseHits += 1
+
+    if value > 0:
+        return CHECKMATE - ply - value
+    elif value < 0:
+        return -CHECKMATE + ply - value - 1
 
+    return STALEMATE
 
-def findAIMove(game_state):
-    global count
 
-    count = 1
+def findAIMove(game_state, time_limit=TIME_LIMIT, max_depth=MAX_DEPTH, workers=1, use_book=True, callback=None):
+    """Iterative deepening: search to depth 1, 2, ... until max_depth is reached or time_limit seconds have passed.
 
-    move = minMaxMove(game_state, depth=MAX_DEPTH)
+    The move of the deepest fully searched iteration is returned. Depth 1 is always completed, whatever the time limit or searchStop.
+    With time_limit=None the search only ends at max_depth or when stopped, which is how pondering is done, see ponderHit.
+    With workers > 1 the root moves are split over a pool of that many processes, see parallelSearch.
+    With use_book, a move of the opening book is played without searching whenever there is one for the position.
+    Returns (move, SearchStats), the move being None if there is no valid move. callback, if given, is called with the SearchStats after every iteration, to follow the search as it goes."""
+
+    if use_book:
+        move = getBookMove(game_state)
+
+        if move is not None:
+            stats = SearchStats()
+            stats.move, stats.book = move, True
+            return move, stats
+
+    if workers > 1:
+        return parallelSearch(game_state, time_limit, max_depth, workers, callback)
+
+    move, stats = searchPosition(game_state, time_limit, max_depth, callback=callback)
 
     if move is None:
-        move = randomMove(game_state.getValidMoves())
+        validMoves = game_state.getValidMoves()
+
+        if validMoves:
+            move = randomMove(validMoves)
+
+    return move, stats
+
+
+def searchPosition(game_state, time_limit=TIME_LIMIT, max_depth=MAX_DEPTH, node_limit=None, callback=None):
+    """The iterative deepening of findAIMove, without the opening book. Returns (move, SearchStats), the move of the deepest fully searched iteration being None if there is no valid move.
+
+    With node_limit the search also stops after about that many nodes. callback, if given, is called with the SearchStats after every iteration."""
+
+    global searchDeadline, searchNodeLimit, searchStats
+
+    searchStats = stats = SearchStats()
+    searchNodeLimit = node_limit
+
+    resetMoveOrdering()
+
+    searchDeadline = None if time_limit is None else time.perf_counter() + time_limit
+    movesMade = len(game_state.moveLog)
+
+    for depth in range(1, min(max_depth, MAX_PLY) + 1):  # Killer moves are kept for MAX_PLY plies
+        alpha, beta = -CHECKMATE, CHECKMATE
+        window = ASPIRATION_WINDOW
+
+        if depth > 1 and abs(stats.score) < CHECKMATE - MATE_SCORES:
+            alpha, beta = stats.score - window, stats.score + window
+
+        try:
+            while True:
+                iterationMove, iterationScore, pv = minMaxMove(game_state, depth, alpha, beta)
+
+                # Outside the window the score is only a bound: widen the window on that side and search again
+                if iterationScore <= alpha and alpha > -CHECKMATE:
+                    alpha = max(iterationScore - window, -CHECKMATE)
+                elif iterationScore >= beta and beta < CHECKMATE:
+                    beta = min(iterationScore + window, CHECKMATE)
+                else:
+                    break
+
+                window *= 4
+                stats.aspirationResearches += 1
+        except SearchTimeout:
+            # Unwind the moves of the aborted iteration
+            while len(game_state.moveLog) > movesMade:
+                game_state.undoMove()
+            break
+
+        stats.addIteration(depth, iterationMove if iterationMove is not None else stats.move, iterationScore, pv)
+
+        if callback is not None:
+            callback(stats)
+
+        if searchExpired():
+            break
+
+    searchDeadline = searchNodeLimit = None
+    stats.finish()
+
+    return stats.move, stats
+
+
+def searchExpired():
+    """Whether the running search has to stop: it has been stopped with searchStop, or has run out of time or nodes."""
+
+    return searchStop.is_set() or (searchDeadline is not None and time.perf_counter() > searchDeadline) or (searchNodeLimit is not None and searchStats.nodes >= searchNodeLimit)
+
+
+def getBookMove(game_state):
+    """A move of the opening book at BOOK_FILE for the current position, or None, also when there is no book."""
+
+    global openingBook
+
+    if openingBook is None:
+        if not os.path.exists(BOOK_FILE):
+            return None
+
+        openingBook = OpeningBook(BOOK_FILE)
+
+    move = openingBook.getMove(game_state)
+
+    return None if move is None else decodeMove(move)
+
 
-    return move
+def ponderHit(time_limit):
+    """Give the running search, started with time_limit=None to ponder on the opponent's expected move, time_limit seconds from now to finish."""
+
+    global searchDeadline
+
+    searchDeadline = time.perf_counter() + time_limit
+
+
+def getPonderMove(game_state):
+    """The reply to expect from the opponent, as found by the last search, or None.
+
+    It is the best move stored in the transposition table for the current position, which was searched right after the engine's own move."""
+
+    entry = transpositionTable.probe(game_state.zobristHash)
+
+    if entry is None or entry[4] not in game_state.getMoveCodes():
+        return None
+
+    return decodeMove(entry[4])
+
+
+searchPool = None
+searchPoolWorkers = 0
+workerStop = None  # Event shared with the workers of searchPool, which they take as their searchStop
+
+
+def initSearchWorker(stop):
+    global searchStop
+
+    searchStop = stop
+
+
+def getSearchPool(workers):
+    """The process pool of the parallel search, kept alive between moves so that the workers keep their transposition tables."""
+
+    global searchPool, searchPoolWorkers, workerStop
+
+    if searchPool is None or searchPoolWorkers != workers:
+        if searchPool is not None:
+            searchPool.shutdown(cancel_futures=True)
+
+        context = multiprocessing.get_context("spawn")
+        workerStop = context.Event()
+
+        searchPool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=initSearchWorker, initargs=(workerStop,))
+        searchPoolWorkers = workers
+
+    return searchPool
+
+
+def waitForWorkers(futures, depth):
+    """The results of the futures of parallelSearch, passing searchStop on to the workers while they search. Depth 1 is not stopped."""
+
+    while wait(futures, timeout=STOP_CHECK_INTERVAL).not_done:
+        if depth > 1 and searchStop.is_set():
+            workerStop.set()
+
+    return [future.result() for future in futures]
+
+
+def parallelSearch(game_state, time_limit=TIME_LIMIT, max_depth=MAX_DEPTH, workers=None, callback=None):
+    """Iterative deepening with the root moves split over a process pool. Returns (move, SearchStats), the counters being those of all workers together.
+
+    At every depth the best move of the previous iteration is searched first, and its score is then given to the workers searching
+    all other root moves in parallel as their alpha bound. Every worker plays on its own copy of game_state.
+    The workers all stop at the same wall-clock deadline, however long their root moves waited in the queue of the pool."""
+
+    pool = getSearchPool(workers or multiprocessing.cpu_count())
+    workerStop.clear()
+    stats = SearchStats()
+
+    rootMoves = orderMoves(game_state, game_state.getMoveCodes(), None, 0)
+
+    if not rootMoves:
+        stats.score = scoreBoard(game_state) * (1 if game_state.whiteToMove else -1)
+        stats.finish()
+        return None, stats
+
+    deadline = None if time_limit is None else time.time() + time_limit  # Wall-clock time, the same in every process
+
+    stats.move = decodeMove(rootMoves[0])
+
+    for depth in range(1, min(max_depth, MAX_PLY) + 1):  # Killer moves are kept for MAX_PLY plies
+        iterationDeadline = None if depth == 1 else deadline
+
+        first = waitForWorkers([pool.submit(searchRootMove, game_state, rootMoves[0], depth, -CHECKMATE, iterationDeadline)], depth)[0]
+        stats.addCounters(first[1])
+        if first[0] is None:
+            break
+
+        futures = [pool.submit(searchRootMove, game_state, rootMove, depth, first[0], iterationDeadline) for rootMove in rootMoves[1:]]
+        results = [first] + waitForWorkers(futures, depth)
+
+        for result in results[1:]:
+            stats.addCounters(result[1])
+
+        scores = [result[0] for result in results]
+
+        if None in scores:  # The iteration ran out of time
+            break
+
+        # Moves that failed low only have an upper bound, but that is good enough to order the next iteration
+        order = sorted(range(len(rootMoves)), key=lambda i: scores[i], reverse=True)
+        rootMoves = [rootMoves[i] for i in order]
+        stats.addIteration(depth, decodeMove(rootMoves[0]), scores[order[0]], results[order[0]][1].pv)
+
+        if callback is not None:
+            callback(stats)
+
+        if searchStop.is_set() or (deadline is not None and time.time() > deadline):
+            break
+
+    stats.finish()
+
+    return stats.move, stats
+
+
+def searchRootMove(game_state, move, depth, alpha, deadline):
+    """Worker task of parallelSearch: search a single root move to the given depth.
+
+    Returns (score, SearchStats) with the score from the point of view of the side making the move, or None if the time.time() deadline passed
+    or the search was stopped first.
+    The principal variation of the SearchStats starts with the move."""
+
+    global searchDeadline, searchStats, rootDepth
+
+    searchStats = SearchStats()
+    rootDepth = depth
+    searchDeadline = None if deadline is None else time.perf_counter() + deadline - time.time()
+
+    turnMultiplier = 1 if game_state.whiteToMove else -1
+
+    if depth > 1 and searchExpired():  # The move waited in the queue of the pool until the search was over
+        searchDeadline = None
+        return None, searchStats
+
+    game_state.makeMove(move)
+
+    pv = []
+
+    try:
+        score = -negaMaxAlphaBeta(game_state, depth - 1, -CHECKMATE, -alpha, -turnMultiplier, 1, True, pv)
+    except SearchTimeout:
+        score = None
+    finally:
+        searchDeadline = None
+
+    searchStats.pv = [move] + pv
+
+    return score, searchStats
 
 
 def randomMove(validMoves):
@@ -176,18 +624,25 @@ def greedyMove(game_state):
     return bestMove
 
 
-def minMaxMove(game_state, depth=MAX_DEPTH):
-    global bestMove
+def minMaxMove(game_state, depth=MAX_DEPTH, alpha=-CHECKMATE, beta=CHECKMATE):
+    """Search the position to depth within the window (alpha, beta). Returns (best move, score, principal variation as packed moves)."""
+
+    global bestMove, rootDepth
     bestMove = None
+    rootDepth = depth
+
+    pv = []
 
     # minMax(game_state, depth, game_state.whiteToMove)
     # negaMax(game_state, depth, 1 if game_state.whiteToMove else -1)
-    negaMaxAlphaBeta(game_state, depth, -CHECKMATE, CHECKMATE, 1 if game_state.whiteToMove else -1)
+    score = negaMaxAlphaBeta(game_state, depth, alpha, beta, 1 if game_state.whiteToMove else -1, 0, True, pv)
 
-    return bestMove
+    return bestMove, score, pv
 
 
 def minMax(game_state, depth, whiteToMove):
+    searchStats.nodes += 1
+
     if depth == 0 or game_state.checkmate or game_state.stalemate:
         return scoreBoard(game_state) if game_state.whiteToMove else -1 * scoreBoard(game_state)
 
@@ -209,7 +664,7 @@ def minMax(game_state, depth, whiteToMove):
                 if score > maxScore:
                     maxScore = score
 
-                    if depth == MAX_DEPTH:
+                    if depth == rootDepth:
                         bestMove = (playerStart, playerEnd)
 
                 game_state.undoMove()
@@ -227,7 +682,7 @@ def minMax(game_state, depth, whiteToMove):
                 if score < minScore:
                     minScore = score
 
-                    if depth == MAX_DEPTH:
+                    if depth == rootDepth:
                         bestMove = (playerStart, playerEnd)
 
                 game_state.undoMove()
@@ -236,6 +691,8 @@ def minMax(game_state, depth, whiteToMove):
 
 
 def negaMax(game_state, depth, turnMultiplier):
+    searchStats.nodes += 1
+
     if depth == 0 or game_state.checkmate or game_state.stalemate:
         return turnMultiplier * scoreBoard(game_state)
 
@@ -257,7 +714,7 @@ def negaMax(game_state, depth, turnMultiplier):
             if score > maxScore:
                 maxScore = score
 
-                if depth == MAX_DEPTH:
+                if depth == rootDepth:
                     bestMove = (playerStart, playerEnd)
 
             game_state.undoMove()
@@ -265,38 +722,185 @@ def negaMax(game_state, depth, turnMultiplier):
     return maxScore
 
 
-def negaMaxAlphaBeta(game_state, depth, alpha, beta, turnMultiplier):
-    global count
-    count += 1
+def negaMaxAlphaBeta(game_state, depth, alpha, beta, turnMultiplier, ply, allowNull=True, pv=None):
+    """Principal variation search. ply counts the moves from the root, which the depth left does not tell once searches are reduced.
+    Only nodes on the principal variation get a pv list, which is filled with the moves expected from the position.
 
-    if depth == 0 or game_state.checkmate or game_state.stalemate:
-        return turnMultiplier * scoreBoard(game_state)
+    Their first move is searched with the full window. The others are expected to be worse, which a search with a zero window shows more cheaply."""
+
+    stats = searchStats
+    stats.nodes += 1
+
+    if not stats.nodes & (NODES_BETWEEN_CLOCK_CHECKS - 1) and rootDepth > 1 and searchExpired():
+        raise SearchTimeout
+
+    if ply:
+        score = probeTablebases(game_state, ply)
+        if score is not None:
+            return score
+
+    if depth == 0:
+        return quiescence(game_state, alpha, beta, turnMultiplier, ply)
+
+    if game_state.checkmate or game_state.stalemate:
+        return -CHECKMATE + ply if game_state.checkmate else STALEMATE  # Mates nearer the root score further from zero
 
     global bestMove
 
-    maxScore = -CHECKMATE
+    key = game_state.zobristHash
+    alphaOriginal = alpha
+    hashMove = None
 
-    moves = game_state.getValidMoves()
+    entry = transpositionTable.probe(key)
+    stats.tableProbes += 1
+    if entry is not None:
+        stats.tableHits += 1
+        hashMove = entry[4]
 
-    for playerStart in moves.keys():
-        for playerEnd in moves[playerStart]:
-            game_state.makeMove(Move(playerStart, playerEnd, game_state.board))
+    if entry is not None and entry[1] >= depth and pv is None:  # Nodes on the principal variation are searched, to find the moves of the variation
+        bound, score = entry[2], scoreFromTable(entry[3], ply)
 
-            score = -negaMaxAlphaBeta(game_state, depth - 1, -beta, -alpha, -1 * turnMultiplier)
+        if bound == EXACT:
+            return score
+        elif bound == LOWER_BOUND:
+            alpha = max(alpha, score)
+        else:
+            beta = min(beta, score)
 
-            if score > maxScore:
-                maxScore = score
+        if alpha >= beta:
+            return score
 
-                if depth == MAX_DEPTH:
-                    bestMove = (playerStart, playerEnd)
+    ally, enemy = ("w", "b") if game_state.whiteToMove else ("b", "w")
+    selective = depth >= REDUCTION_MIN_DEPTH and not game_state.isSquareAttacked(game_state.whiteKing if game_state.whiteToMove else game_state.blackKing, enemy)
 
-            game_state.undoMove()
+    # Null move pruning: if passing the turn still fails high on a shallower search, a move surely would too. Not twice in a row, as then nothing is searched
+    if (selective and allowNull and pv is None and beta < CHECKMATE
+            and game_state.material[ally] - PIECE_VALUES[ally + "P"] * bin(game_state.bitboards[ally + "P"]).count("1") >= NULL_MOVE_MATERIAL
+            and turnMultiplier * scoreBoard(game_state) >= beta):
+        game_state.makeNullMove()
+        score = -negaMaxAlphaBeta(game_state, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW, -turnMultiplier, ply + 1, False)
+        game_state.undoNullMove()
 
-            if maxScore > alpha:
-                alpha = maxScore
-            if alpha >= beta:
-                break
+        if score >= beta:
+            stats.nullMoveCutoffs += 1
+            return beta
+
+    maxScore = -CHECKMATE - 1  # Below any score, so that a move is found even when all of them lose
+    nodeBestMove = None
+    movesSearched = 0
+
+    killers = killerMoves[ply]
+
+    # Moves are generated in stages, so a cutoff by the hash move or a capture spares generating the quiet moves
+    for move in game_state.generateMoveCodes(hashMove, lambda moves: orderMoves(game_state, moves, None, ply)):
+        movesSearched += 1
+        game_state.makeMove(move)
+
+        childPv = None if pv is None else []
+
+        if movesSearched == 1:
+            score = -negaMaxAlphaBeta(game_state, depth - 1, -beta, -alpha, -1 * turnMultiplier, ply + 1, True, childPv)
+        else:
+            score = None
+
+            # Late move reductions: quiet moves ordered late seldom turn out best, so they are first searched a ply shallower
+            if (selective and movesSearched >= LATE_MOVE_NUMBER and not move & (MOVE_CAPTURE | MOVE_EN_PASSANT | MOVE_PROMOTION) and move not in killers
+                    and not game_state.isSquareAttacked(game_state.whiteKing if game_state.whiteToMove else game_state.blackKing, ally)):
+                stats.reductions += 1
+                score = -negaMaxAlphaBeta(game_state, depth - 2, -alpha - NULL_WINDOW, -alpha, -turnMultiplier, ply + 1)
+
+                if score > alpha:
+                    stats.researches += 1
+
+            if score is None or score > alpha:
+                score = -negaMaxAlphaBeta(game_state, depth - 1, -alpha - NULL_WINDOW, -alpha, -turnMultiplier, ply + 1)
+
+                # Better than the first move after all: search it again with the full window, to get its exact score and its variation
+                if pv is not None and alpha < score < beta:
+                    score = -negaMaxAlphaBeta(game_state, depth - 1, -beta, -alpha, -turnMultiplier, ply + 1, True, childPv)
+
+        if score > maxScore:
+            maxScore = score
+            nodeBestMove = move
+
+            if ply == 0:
+                bestMove = decodeMove(move)
+
+            if pv is not None:  # Also when no move reaches alpha, so that the first move searched always leaves its line
+                pv[:] = [move] + childPv
+
+        game_state.undoMove()
+
+        if maxScore > alpha:
+            alpha = maxScore
         if alpha >= beta:
+            stats.betaCutoffs += 1
+            if movesSearched == 1:
+                stats.firstMoveCutoffs += 1
+            if not move & (MOVE_CAPTURE | MOVE_EN_PASSANT | MOVE_PROMOTION):
+                storeCutoff(move, depth, ply)
             break
 
+    if not movesSearched:
+        return -CHECKMATE + ply if game_state.inCheck else STALEMATE
+
+    if maxScore <= alphaOriginal:
+        bound = UPPER_BOUND
+    elif maxScore >= beta:
+        bound = LOWER_BOUND
+    else:
+        bound = EXACT
+
+    transpositionTable.store(key, depth, bound, scoreToTable(maxScore, ply), nodeBestMove)
+
+    return maxScore
+
+
+def quiescence(game_state, alpha, beta, turnMultiplier, ply):
+    """Search captures and promotions only, until the position is quiet, so that the score of a leaf is not taken in the middle of an exchange.
+
+    The side to move may stand pat: take the static score instead of capturing. In check all replies are searched, as standing pat is not an option."""
+
+    stats = searchStats
+    stats.nodes += 1
+    stats.quiescenceNodes += 1
+
+    if not stats.nodes & (NODES_BETWEEN_CLOCK_CHECKS - 1) and rootDepth > 1 and searchExpired():
+        raise SearchTimeout
+
+    score = probeTablebases(game_state, ply)
+    if score is not None:
+        return score
+
+    moves = game_state.getCaptureCodes()
+
+    if game_state.inCheck:
+        moves = game_state.getMoveCodes()
+
+        if not moves:
+            return -CHECKMATE + ply
+
+        maxScore = -CHECKMATE
+    else:
+        maxScore = turnMultiplier * scoreBoard(game_state)
+
+        if maxScore >= beta:
+            return maxScore
+
+    if maxScore > alpha:
+        alpha = maxScore
+
+    for move in orderMoves(game_state, moves, None, min(ply, MAX_PLY - 1)):
+        game_state.makeMove(move)
+        score = -quiescence(game_state, -beta, -alpha, -turnMultiplier, ply + 1)
+        game_state.undoMove()
+
+        if score > maxScore:
+            maxScore = score
+
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
     return maxScore
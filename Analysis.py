@@ -0,0 +1,154 @@
+# Batch analysis: search every position of an EPD or FEN file, one per line, and write the results as JSON lines in the order of the input.
+# Runs without pygame, e.g. "python Analysis.py positions.epd --depth 6 --output results.jsonl". The positions are spread over one process per core.
+
+import json
+import multiprocessing
+import re
+import sys
+import time
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import AI
+from Engine import Game, encodeMove, moveToUci
+
+QUEUED_PER_WORKER = 4  # Positions handed to the pool ahead of the result being written, so that workers never wait while memory stays bounded
+
+_operationPattern = re.compile(r'\s*([A-Za-z]\w*)((?:\s*(?:"[^"]*"|[^;"\s]+))*)\s*;')
+
+
+def parseLine(line):
+    """(FEN, operations) of a line of an EPD or FEN file, or None for a blank line or a comment.
+
+    The operations are those of EPD, e.g. {"id": "WAC.001", "bm": "Qg6"}. Their halfmove clock and move number, hmvc and fmvn, go into the FEN."""
+
+    line = line.strip()
+
+    if not line or line.startswith("#"):
+        return None
+
+    fields = line.split(maxsplit=4)
+
+    if len(fields) < 5:
+        return line, {}
+
+    rest = fields[4]
+    clocks = rest.split()
+
+    if len(clocks) <= 2 and all(clock.isdigit() for clock in clocks):  # A FEN with its clocks
+        return line, {}
+
+    operations = {name: value.strip().strip('"') for name, value in _operationPattern.findall(rest)}
+    fen = " ".join(fields[:4] + [operations.get("hmvc", "0"), operations.get("fmvn", "1")])
+
+    return fen, operations
+
+
+def analysePosition(fen, time_limit, max_depth):
+    """Worker task: search the position of fen. Returns the result as a dict, with "error" set for an invalid FEN or a position the search failed on."""
+
+    try:
+        game_state = Game.fromFen(fen)
+    except ValueError as error:
+        return {"error": str(error)}
+
+    AI.transpositionTable.clear()  # So that the result does not depend on the positions the worker searched before
+
+    try:
+        move, stats = AI.searchPosition(game_state, time_limit, max_depth)
+
+        result = {"bestmove": None, "uci": None, "pv": [moveToUci(move) for move in stats.pv], "score": round(stats.score, 2), "depth": stats.depth, "nodes": stats.nodes, "time": round(stats.elapsed, 3)}
+
+        if move is not None:
+            code = encodeMove(move[0], move[1], game_state.board)
+
+            result["bestmove"] = game_state.toSan(code)
+            result["uci"] = moveToUci(code)
+    except Exception as error:  # One position should not end the analysis of the whole file
+        return {"error": f"{type(error).__name__}: {error}"}
+
+    return result
+
+
+def formatResult(fen, operations, result):
+    """The JSON line of a position. Best moves and moves to avoid given in EPD are checked against the move found."""
+
+    record = {"fen": fen}
+
+    if "id" in operations:
+        record["id"] = operations["id"]
+
+    record.update(result)
+
+    move = (result.get("bestmove") or "").rstrip("+#")
+
+    if "bm" in operations:
+        record["solved"] = move in [san.rstrip("+#!?") for san in operations["bm"].split()]
+    elif "am" in operations:
+        record["solved"] = move not in [san.rstrip("+#!?") for san in operations["am"].split()]
+
+    return json.dumps(record)
+
+
+def analyseFile(lines, output, time_limit=None, max_depth=AI.MAX_DEPTH, workers=None):
+    """Analyse the positions of the lines and write a JSON line for each to output, in the order of the input. Returns (positions, nodes).
+
+    The lines are read as the pool works through them, so files of any size can be analysed."""
+
+    workers = workers or multiprocessing.cpu_count()
+    positions = nodes = 0
+    pending = deque()
+
+    def writeNext():
+        nonlocal positions, nodes
+
+        fen, operations, future = pending.popleft()
+        result = future.result()
+
+        output.write(formatResult(fen, operations, result) + "\n")
+        output.flush()
+
+        positions += 1
+        nodes += result.get("nodes", 0)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for line in lines:
+            position = parseLine(line)
+
+            if position is None:
+                continue
+
+            fen, operations = position
+            pending.append((fen, operations, pool.submit(analysePosition, fen, time_limit, max_depth)))
+
+            if len(pending) >= workers * QUEUED_PER_WORKER:
+                writeNext()
+
+        while pending:
+            writeNext()
+
+    return positions, nodes
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Analyse the positions of an EPD or FEN file with AI.py, writing a JSON line with the best move, score, depth and nodes of each.")
+    parser.add_argument("input", help='EPD or FEN file with one position per line, or "-" for standard input')
+    parser.add_argument("--output", help="file to write the results to, instead of standard output")
+    parser.add_argument("--depth", type=int, help=f"depth to search each position to, by default {AI.MAX_DEPTH}")
+    parser.add_argument("--time", type=float, help=f"seconds to search each position for, by default {AI.TIME_LIMIT} when no depth is given")
+    parser.add_argument("--workers", type=int, help="number of worker processes, by default one per core")
+    args = parser.parse_args()
+
+    if args.depth is None and args.time is None:
+        args.time = AI.TIME_LIMIT
+
+    inputFile = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    outputFile = sys.stdout if args.output is None else open(args.output, "w", encoding="utf-8")
+
+    start = time.perf_counter()
+
+    with inputFile, outputFile:
+        positions, nodes = analyseFile(inputFile, outputFile, args.time, args.depth or AI.MAX_DEPTH, args.workers)
+
+    elapsed = time.perf_counter() - start
+    print(f"{positions} positions in {elapsed:.1f} s, {positions / elapsed:.2f} positions/s, {nodes / elapsed:.0f} nodes/s", file=sys.stderr)
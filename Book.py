@@ -0,0 +1,121 @@
+# Opening book: a sorted binary file of (position hash, move, weight) records, built from PGN game collections.
+# Build one with e.g. "python Book.py games.pgn more_games.pgn --output book.bin". AI.findAIMove plays from AI.BOOK_FILE when it exists.
+# The file is memory-mapped read-only, so any number of engine processes share a single copy of it through the page cache.
+
+import mmap
+import os
+import random
+import struct
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+from Engine import Game
+from Pgn import readGames
+
+RECORD = struct.Struct("<QHH")  # Zobrist hash of the position, packed move, weight
+
+BOOK_PLIES = 20  # Only the first moves of each game go into the book
+MAX_WEIGHT = 0xFFFF
+
+
+class OpeningBook:
+    """Read-only view of a book file. Records are sorted by hash, so the moves of a position are found with a binary search."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            # An empty file cannot be mapped
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size else b""
+
+        self.size = len(self.data) // RECORD.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def probe(self, key):
+        """The (packed move, weight) records of the position with the given Zobrist hash."""
+
+        low, high = 0, self.size
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if RECORD.unpack_from(self.data, middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        moves = []
+
+        while low < self.size:
+            recordKey, move, weight = RECORD.unpack_from(self.data, low * RECORD.size)
+
+            if recordKey != key:
+                break
+
+            moves.append((move, weight))
+            low += 1
+
+        return moves
+
+    def getMove(self, game_state, rng=random):
+        """A book move for the current position, as a packed move picked at random in proportion to its weight, or None.
+
+        Only valid moves are returned, so a hash collision cannot lead to an illegal move."""
+
+        moves = self.probe(game_state.zobristHash)
+
+        if not moves:
+            return None
+
+        validMoves = set(game_state.getMoveCodes())
+        moves = [(move, weight) for move, weight in moves if move in validMoves]
+
+        if not moves:
+            return None
+
+        return rng.choices([move for move, weight in moves], [weight for move, weight in moves])[0]
+
+
+def buildBook(pgnPaths, outputPath, plies=BOOK_PLIES, minCount=1):
+    """Count how often each move was played from each position in the first plies of the games, and write the records sorted by hash.
+
+    Moves played fewer than minCount times are left out. Returns the number of records written."""
+
+    counts = Counter()
+
+    for path in pgnPaths:
+        with open(path, encoding="utf-8", errors="replace") as file:
+            for game in readGames(file):
+                game_state = Game.fromFen(game.tags["FEN"]) if "FEN" in game.tags else Game()
+
+                for san in game.moves[:plies]:
+                    try:
+                        move = game_state.parseSan(san)
+                    except ValueError:  # Unknown notation, or an under-promotion
+                        break
+
+                    counts[(game_state.zobristHash, move)] += 1
+                    game_state.makeMove(move)
+
+    records = sorted((key, move, min(count, MAX_WEIGHT)) for (key, move), count in counts.items() if count >= minCount)
+
+    with open(outputPath, "wb") as file:
+        for record in records:
+            file.write(RECORD.pack(*record))
+
+    return len(records)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Build an opening book for AI.findAIMove from PGN files.")
+    parser.add_argument("pgn", nargs="+", help="PGN files to read the games from")
+    parser.add_argument("--output", default="book.bin")
+    parser.add_argument("--plies", type=int, default=BOOK_PLIES, help="number of half-moves of each game to add")
+    parser.add_argument("--min-count", type=int, default=1, help="leave out moves played fewer times than this")
+    args = parser.parse_args()
+
+    records = buildBook(args.pgn, args.output, args.plies, args.min_count)
+    print(f"{records} positions and moves written to {args.output}")
+
+    sys.exit(0 if records else 1)
@@ -1,4 +1,229 @@
-from copy import deepcopy
+import random
+
+# Castling rights are a bitmask, with one bit for each rook that may still castle, keyed here by the rook's starting square
+CASTLE_RIGHTS = {(7, 7): 1, (7, 0): 2, (0, 7): 4, (0, 0): 8}
+ALL_CASTLE_RIGHTS = 15
+
+FEN_CASTLE_RIGHTS = (("K", (7, 7)), ("Q", (7, 0)), ("k", (0, 7)), ("q", (0, 0)))  # In the order FEN lists them
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+FIFTY_MOVE_PLIES = 100  # A game is drawn once the halfmove clock reaches this
+
+# Zobrist keys, generated from a fixed seed so that hashes are stable between runs
+_zobristRandom = random.Random(20211105)
+
+ZOBRIST_PIECES = {color + piece: tuple(tuple(_zobristRandom.getrandbits(64) for _ in range(8)) for _ in range(8)) for color in "wb" for piece in "KQRBNP"}
+_zobristCastleKeys = {(7, 0): _zobristRandom.getrandbits(64), (7, 7): _zobristRandom.getrandbits(64), (0, 0): _zobristRandom.getrandbits(64), (0, 7): _zobristRandom.getrandbits(64)}
+ZOBRIST_EN_PASSANT = tuple(_zobristRandom.getrandbits(64) for _ in range(8))
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+
+
+def _castleKey(rights):
+    key = 0
+
+    for square, right in CASTLE_RIGHTS.items():
+        if rights & right:
+            key ^= _zobristCastleKeys[square]
+
+    return key
+
+
+ZOBRIST_CASTLE = tuple(_castleKey(rights) for rights in range(ALL_CASTLE_RIGHTS + 1))  # Indexed by the castling rights bitmask
+
+# Bitboards: square board[row][col] has index row * 8 + col, and is bit (1 << index) of a bitboard
+SQUARES = tuple((index >> 3, index & 7) for index in range(64))
+SQUARE_BITS = tuple(tuple(1 << (row * 8 + col) for col in range(8)) for row in range(8))
+LIGHT_SQUARES = sum(1 << (row * 8 + col) for row in range(8) for col in range(8) if (row + col) % 2 == 0)
+
+KNIGHT_DIRECTIONS = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2))
+ROOK_DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+KING_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+
+def _stepMask(row, col, directions):
+    mask = 0
+
+    for dr, dc in directions:
+        if 0 <= row + dr <= 7 and 0 <= col + dc <= 7:
+            mask |= SQUARE_BITS[row + dr][col + dc]
+
+    return mask
+
+
+def _rayMask(row, col, direction):
+    mask = 0
+    row, col = row + direction[0], col + direction[1]
+
+    while 0 <= row <= 7 and 0 <= col <= 7:
+        mask |= SQUARE_BITS[row][col]
+        row, col = row + direction[0], col + direction[1]
+
+    return mask
+
+
+KNIGHT_ATTACKS = tuple(_stepMask(row, col, KNIGHT_DIRECTIONS) for row, col in SQUARES)
+KING_ATTACKS = tuple(_stepMask(row, col, KING_DIRECTIONS) for row, col in SQUARES)
+PAWN_ATTACKS = {"w": tuple(_stepMask(row, col, ((-1, -1), (-1, 1))) for row, col in SQUARES),  # Squares attacked by a pawn of that color standing on the square
+                "b": tuple(_stepMask(row, col, ((1, -1), (1, 1))) for row, col in SQUARES)}
+RAY_MASKS = tuple({direction: _rayMask(row, col, direction) for direction in KING_DIRECTIONS} for row, col in SQUARES)
+
+# The castling rights that are kept when a piece moves from, or onto, each square: a king or rook leaving home, or a rook being captured there, loses them
+_castleRightsLost = {**CASTLE_RIGHTS, (7, 4): CASTLE_RIGHTS[(7, 7)] | CASTLE_RIGHTS[(7, 0)], (0, 4): CASTLE_RIGHTS[(0, 7)] | CASTLE_RIGHTS[(0, 0)]}
+CASTLE_RIGHTS_KEPT = tuple(ALL_CASTLE_RIGHTS & ~_castleRightsLost.get(square, 0) for square in SQUARES)
+
+
+def _betweenMasks(row, col):
+    masks = [0] * 64
+
+    for dr, dc in KING_DIRECTIONS:
+        mask = 0
+        r, c = row + dr, col + dc
+
+        while 0 <= r <= 7 and 0 <= c <= 7:
+            masks[r * 8 + c] = mask
+            mask |= SQUARE_BITS[r][c]
+            r, c = r + dr, c + dc
+
+    return tuple(masks)
+
+
+# BETWEEN_MASKS[a][b] holds the squares strictly between square indices a and b when they share a row, column or diagonal, else 0
+BETWEEN_MASKS = tuple(_betweenMasks(row, col) for row, col in SQUARES)
+
+pawnScores = ((8, 8, 8, 8, 8, 8, 8, 8),
+              (8, 8, 8, 8, 8, 8, 8, 8),
+              (5, 6, 6, 7, 7, 6, 6, 5),
+              (2, 3, 3, 5, 5, 3, 3, 2),
+              (1, 2, 2, 4, 4, 2, 2, 1),
+              (1, 1, 2, 3, 3, 2, 1, 1),
+              (1, 1, 1, 0, 0, 1, 1, 1),
+              (0, 0, 0, 0, 0, 0, 0, 0))
+
+knightScores = ((1, 1, 1, 1, 1, 1, 1, 1),
+                (1, 2, 2, 2, 2, 2, 2, 1),
+                (1, 2, 3, 3, 3, 3, 2, 1),
+                (1, 2, 3, 4, 4, 3, 2, 1),
+                (1, 2, 3, 4, 4, 3, 2, 1),
+                (1, 2, 3, 3, 3, 3, 2, 1),
+                (1, 2, 2, 2, 2, 2, 2, 1),
+                (1, 1, 1, 1, 1, 1, 1, 1))
+
+bishopScores = ((4, 3, 2, 1, 1, 2, 3, 4),
+                (3, 4, 3, 2, 2, 3, 4, 3),
+                (2, 3, 4, 3, 3, 4, 3, 2),
+                (1, 2, 3, 4, 4, 3, 2, 1),
+                (1, 2, 3, 4, 4, 3, 2, 1),
+                (2, 3, 4, 3, 3, 4, 3, 2),
+                (3, 4, 3, 2, 2, 3, 4, 3),
+                (4, 3, 2, 1, 1, 2, 3, 4))
+
+rookScores = ((4, 3, 4, 4, 4, 4, 3, 4),
+              (4, 4, 4, 4, 4, 4, 4, 4),
+              (1, 1, 2, 3, 3, 2, 1, 1),
+              (1, 2, 3, 4, 4, 3, 1, 1),
+              (1, 2, 3, 4, 4, 3, 1, 1),
+              (1, 1, 2, 3, 3, 2, 1, 1),
+              (4, 4, 4, 4, 4, 4, 4, 4),
+              (4, 3, 4, 4, 4, 4, 3, 4))
+
+queenScores = ((1, 1, 1, 3, 1, 1, 1, 1),
+               (1, 2, 3, 3, 3, 1, 1, 1),
+               (1, 4, 3, 3, 3, 4, 2, 1),
+               (1, 2, 3, 3, 3, 2, 2, 1),
+               (1, 2, 3, 3, 3, 2, 2, 1),
+               (1, 4, 3, 3, 3, 4, 2, 1),
+               (1, 2, 3, 3, 3, 1, 1, 1),
+               (1, 1, 1, 3, 1, 1, 1, 1))
+
+kingScores = ((1, 1, 1, 1, 1, 1, 1, 1),
+              (1, 1, 1, 1, 1, 1, 1, 1),
+              (1, 1, 1, 1, 1, 1, 1, 1),
+              (1, 1, 1, 1, 1, 1, 1, 1),
+              (2, 1, 1, 1, 1, 1, 1, 2),
+              (2, 2, 1, 1, 1, 1, 2, 2),
+              (2, 2, 1, 1, 1, 1, 2, 2),
+              (3, 4, 3, 2, 2, 3, 4, 3))
+
+pieceValue = {"K": (0, kingScores), "Q": (9, queenScores), "R": (5, rookScores), "B": (3, bishopScores), "N": (3, knightScores), "P": (1, pawnScores)}
+
+# Packed moves: an int holding the start square index in bits 0-5, the end square index in bits 6-11, and the MOVE_ flags.
+# Castling is encoded with the king's end square, and promotions are always to a queen
+MOVE_CAPTURE = 1 << 12
+MOVE_EN_PASSANT = 1 << 13
+MOVE_CASTLE = 1 << 14
+MOVE_PROMOTION = 1 << 15
+
+
+def encodeMove(start, end, board):
+    """Pack the move from start to end, as found in the dict of getValidMoves, into an int."""
+
+    piece = board[start[0]][start[1]]
+    target = board[end[0]][end[1]]
+
+    code = start[0] * 8 + start[1]
+
+    if piece[1] == "K" and abs(start[1] - end[1]) > 1:
+        return code | (end[0] * 8 + (6 if end[1] in (6, 7) else 2)) << 6 | MOVE_CASTLE
+
+    code |= (end[0] * 8 + end[1]) << 6
+
+    if target[0] not in (piece[0], "-"):
+        code |= MOVE_CAPTURE
+    elif piece[1] == "P" and start[1] != end[1]:
+        code |= MOVE_EN_PASSANT
+
+    if piece[1] == "P" and end[0] in (0, 7):
+        code |= MOVE_PROMOTION
+
+    return code
+
+
+def bitboardSquares(bitboard):
+    """The squares of the set bits of a bitboard, as (row, col) in index order."""
+
+    squares = []
+
+    while bitboard:
+        bit = bitboard & -bitboard
+        bitboard ^= bit
+        squares.append(SQUARES[bit.bit_length() - 1])
+
+    return squares
+
+
+def decodeMove(code):
+    """The (start, end) squares of a packed move."""
+
+    return SQUARES[code & 63], SQUARES[code >> 6 & 63]
+
+
+def squareName(square):
+    """Name of the (row, col) square, e.g. "e4"."""
+
+    return "abcdefgh"[square[1]] + str(8 - square[0])
+
+
+def moveToUci(code):
+    """The packed move in the long algebraic notation of UCI, e.g. "e2e4", "e1g1" for castling or "e7e8q"."""
+
+    return squareName(SQUARES[code & 63]) + squareName(SQUARES[code >> 6 & 63]) + ("q" if code & MOVE_PROMOTION else "")
+
+
+def parseSquare(name):
+    """The (row, col) square of a name such as "e4"."""
+
+    if len(name) != 2 or name[0] not in "abcdefgh" or name[1] not in "12345678":
+        raise ValueError(f"Invalid square {name!r}")
+
+    return 8 - int(name[1]), "abcdefgh".index(name[0])
+
+
+# Evaluation tables used by Game to keep its scores up to date. Black's piece-square scores are mirrored and negated, so that the positional score is always from white's point of view
+PIECE_VALUES = {color + piece: value for color in "wb" for piece, (value, scores) in pieceValue.items()}
+POSITION_SCORES = {**{"w" + piece: scores for piece, (value, scores) in pieceValue.items()},
+                   **{"b" + piece: tuple(tuple(-score for score in row) for row in scores[::-1]) for piece, (value, scores) in pieceValue.items()}}
 
 
 class Game:
@@ -22,12 +247,6 @@ class Game:
         self.whiteKing = (7, 4)
         self.blackKing = (0, 4)
 
-        self.whitePieces = [(6, 0), (6, 1), (6, 2), (6, 3), (6, 4), (6, 5), (6, 6), (6, 7), (7, 0), (7, 1), (7, 2), (7, 3), (7, 4), (7, 5), (7, 6), (7, 7)]
-        self.blackPieces = [(0, 0), (0, 1), (0, 2), (0, 3), (0, 4), (0, 5), (0, 6), (0, 7), (1, 0), (1, 1), (1, 2), (1, 3), (1, 4), (1, 5), (1, 6), (1, 7)]
-
-        self.whitePieces.sort()
-        self.blackPieces.sort(reverse=True)
-
         self.moveFunctions = {"P": self.getPawnMoves, "N": self.getKnightMoves, "B": self.getBishopMoves, "R": self.getRookMoves, "Q": self.getQueenMoves, "K": self.getKingMoves}
 
         self.inCheck = False
@@ -41,7 +260,304 @@ class Game:
 
         self.moveLog = []
 
-        self.castlePossible = {"w": [(7, 0), (7, 7)], "b": [(0, 0), (0, 7)]}
+        self.castleRights = ALL_CASTLE_RIGHTS
+        self.enPassantSquare = None  # Square a pawn that has just made a double step has passed over, as (row, col)
+        self.halfmoveClock = 0  # Moves since the last capture or pawn move
+        self.fullmoveNumber = 1
+
+        # (castleRights, enPassantSquare, halfmoveClock, pieceCaptured, zobristHash, white material, black material, positionalScore) from before each move of moveLog, so that undoMove can restore them
+        self.stateLog = []
+
+        self.bitboards, self.occupancy = self.computeBitboards()
+
+        self.zobristHash = self.computeHash()
+
+        self.material, self.positionalScore = self.computeScores()
+
+    @classmethod
+    def fromFen(cls, fen):
+        """A game starting from the position of a FEN string. The castling, en passant and move number fields may be left out. Raises ValueError for an invalid FEN."""
+
+        fields = fen.split()
+
+        if len(fields) < 2 or fields[1] not in ("w", "b"):
+            raise ValueError(f"Invalid FEN {fen!r}")
+
+        game_state = cls()
+
+        game_state.board = []
+        for rank in fields[0].split("/"):
+            row = []
+            for char in rank:
+                if char in "12345678":
+                    row += ["--"] * int(char)
+                elif char in "KQRBNPkqrbnp":
+                    row.append(("w" if char.isupper() else "b") + char.upper())
+                else:
+                    raise ValueError(f"Invalid FEN {fen!r}")
+
+            if len(row) != 8:
+                raise ValueError(f"Invalid FEN {fen!r}")
+            game_state.board.append(row)
+
+        if len(game_state.board) != 8:
+            raise ValueError(f"Invalid FEN {fen!r}")
+
+        if any(piece[1] == "P" for piece in game_state.board[0] + game_state.board[7]):
+            raise ValueError(f"Invalid FEN {fen!r}, pawns cannot stand on the first or last rank")
+
+        game_state.whiteToMove = fields[1] == "w"
+
+        game_state.bitboards, game_state.occupancy = game_state.computeBitboards()
+
+        for king in ("wK", "bK"):
+            if bin(game_state.bitboards[king]).count("1") != 1:
+                raise ValueError(f"Invalid FEN {fen!r}, each side needs one king")
+
+        game_state.whiteKing = SQUARES[game_state.bitboards["wK"].bit_length() - 1]
+        game_state.blackKing = SQUARES[game_state.bitboards["bK"].bit_length() - 1]
+
+        # Rights are only kept if the king and the rook are still on their squares
+        rights = fields[2] if len(fields) > 2 else "-"
+        game_state.castleRights = 0
+        for char, square in FEN_CASTLE_RIGHTS:
+            color = "w" if char.isupper() else "b"
+            if char in rights and game_state.board[square[0]][square[1]] == color + "R" and game_state.board[square[0]][4] == color + "K":
+                game_state.castleRights |= CASTLE_RIGHTS[square]
+
+        game_state.enPassantSquare = parseSquare(fields[3]) if len(fields) > 3 and fields[3] != "-" else None
+
+        # The square a pawn of the other side just passed over, moving two squares forward
+        if game_state.enPassantSquare is not None:
+            row, col = game_state.enPassantSquare
+            ahead = 1 if game_state.whiteToMove else -1
+            pawn = ("b" if game_state.whiteToMove else "w") + "P"
+
+            if row != (2 if game_state.whiteToMove else 5) or game_state.board[row][col] != "--" or game_state.board[row - ahead][col] != "--" or game_state.board[row + ahead][col] != pawn:
+                raise ValueError(f"Invalid FEN {fen!r}, no pawn can be taken en passant on {fields[3]}")
+
+        try:
+            game_state.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            game_state.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Invalid FEN {fen!r}") from None
+
+        game_state.zobristHash = game_state.computeHash()
+        game_state.material, game_state.positionalScore = game_state.computeScores()
+
+        return game_state
+
+    def toFen(self):
+        """The current position as a FEN string."""
+
+        ranks = []
+
+        for row in self.board:
+            rank, empty = "", 0
+
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1] if piece[0] == "w" else piece[1].lower()
+
+            ranks.append(rank + (str(empty) if empty else ""))
+
+        rights = "".join(char for char, square in FEN_CASTLE_RIGHTS if self.castleRights & CASTLE_RIGHTS[square]) or "-"
+        enPassant = "-" if self.enPassantSquare is None else squareName(self.enPassantSquare)
+
+        return f"{'/'.join(ranks)} {'w' if self.whiteToMove else 'b'} {rights} {enPassant} {self.halfmoveClock} {self.fullmoveNumber}"
+
+    def toSan(self, move):
+        """The valid move, given as a packed int, in standard algebraic notation, e.g. "Nbd7", "exd5", "O-O" or "e8=Q+"."""
+
+        start, end = decodeMove(move)
+        piece = self.board[start[0]][start[1]][1]
+        state = (self.validMoves, self.inCheck, self.checkmate, self.stalemate, self.checks, self.xRayChecks)
+
+        if move & MOVE_CASTLE:
+            san = "O-O" if end[1] == 6 else "O-O-O"
+        elif piece == "P":
+            san = (squareName(start)[0] + "x" if move & (MOVE_CAPTURE | MOVE_EN_PASSANT) else "") + squareName(end) + ("=Q" if move & MOVE_PROMOTION else "")
+        else:
+            # Other pieces of the same kind that can move to the same square
+            others = [SQUARES[other & 63] for other in self.getMoveCodes() if other != move and other >> 6 & 63 == move >> 6 & 63 and self.board[other >> 3 & 7][other & 7][1] == piece]
+
+            if not others:
+                hint = ""
+            elif all(other[1] != start[1] for other in others):
+                hint = squareName(start)[0]
+            elif all(other[0] != start[0] for other in others):
+                hint = squareName(start)[1]
+            else:
+                hint = squareName(start)
+
+            san = piece + hint + ("x" if move & MOVE_CAPTURE else "") + squareName(end)
+
+        self.makeMove(move)
+        self.getValidMoves()
+        san += "#" if self.checkmate else "+" if self.inCheck else ""
+        self.undoMove()
+
+        self.validMoves, self.inCheck, self.checkmate, self.stalemate, self.checks, self.xRayChecks = state
+
+        return san
+
+    def parseSan(self, san):
+        """The valid move written in standard algebraic notation, as a packed int. Raises ValueError if there is no such move, or for a promotion to another piece than a queen."""
+
+        text = san.rstrip("+#!?")
+
+        if not text:
+            raise ValueError(f"Invalid move {san!r}")
+
+        moves = self.getMoveCodes()
+
+        if text.replace("0", "O") in ("O-O", "O-O-O"):
+            matches = [move for move in moves if move & MOVE_CASTLE and move >> 6 & 7 == (6 if text.replace("0", "O") == "O-O" else 2)]
+        else:
+            promotion = text[-1] in "QRBN" and len(text) > 2 and text[-2] in "=12345678"
+            if promotion:
+                if text[-1] != "Q":
+                    raise ValueError(f"Only promotions to a queen are supported: {san!r}")
+                text = text[:-1].rstrip("=")
+
+            piece = text[0] if text[0] in "KQRBN" else "P"
+            text = (text[1:] if piece != "P" else text).replace("x", "")
+
+            try:
+                end = parseSquare(text[-2:])
+            except ValueError:
+                raise ValueError(f"Invalid move {san!r}") from None
+
+            hint = text[:-2]
+
+            matches = []
+            for move in moves:
+                start = SQUARES[move & 63]
+
+                if SQUARES[move >> 6 & 63] != end or self.board[start[0]][start[1]][1] != piece or bool(move & MOVE_PROMOTION) != promotion:
+                    continue
+
+                if all(start[1] == "abcdefgh".index(char) if char in "abcdefgh" else start[0] == 8 - int(char) for char in hint if char in "abcdefgh12345678"):
+                    matches.append(move)
+
+        if len(matches) != 1:
+            raise ValueError(f"{'Ambiguous' if matches else 'Invalid'} move {san!r} in {self.toFen()}")
+
+        return matches[0]
+
+    def parseUci(self, text):
+        """The valid move written in the long algebraic notation of UCI, as a packed int. Raises ValueError if there is no such move."""
+
+        for move in self.getMoveCodes():
+            if moveToUci(move) == text:
+                return move
+
+        raise ValueError(f"Invalid move {text!r} in {self.toFen()}")
+
+    @property
+    def whitePieces(self):
+        """Squares of the white pieces, read from the occupancy bitboard that makeMove and undoMove keep up to date."""
+
+        return bitboardSquares(self.occupancy["w"])
+
+    @property
+    def blackPieces(self):
+        return bitboardSquares(self.occupancy["b"])
+
+    def computeScores(self):
+        """Material of each side, e.g. material["w"], and the sum of the piece-square scores from white's point of view. makeMove and undoMove keep both up to date incrementally."""
+
+        material = {"w": 0, "b": 0}
+        positionalScore = 0
+
+        for r, c in self.whitePieces + self.blackPieces:
+            piece = self.board[r][c]
+            material[piece[0]] += PIECE_VALUES[piece]
+            positionalScore += POSITION_SCORES[piece][r][c]
+
+        return material, positionalScore
+
+    def computeBitboards(self):
+        """Bitboards of the current board: one per piece, e.g. bitboards["wN"], and one per color with all its pieces, e.g. occupancy["w"]."""
+
+        bitboards = {color + piece: 0 for color in "wb" for piece in "KQRBNP"}
+        occupancy = {"w": 0, "b": 0}
+
+        for r, row in enumerate(self.board):
+            for c, piece in enumerate(row):
+                if piece != "--":
+                    bitboards[piece] |= SQUARE_BITS[r][c]
+                    occupancy[piece[0]] |= SQUARE_BITS[r][c]
+
+        return bitboards, occupancy
+
+    def togglePiece(self, piece, r, c):
+        """Add piece to, or remove it from, the bitboards at (r, c). The board itself is not touched."""
+
+        bit = SQUARE_BITS[r][c]
+        self.bitboards[piece] ^= bit
+        self.occupancy[piece[0]] ^= bit
+
+    def computeHash(self):
+        """Zobrist hash of the current position, computed from scratch. makeMove and undoMove keep self.zobristHash up to date incrementally."""
+
+        h = 0
+
+        for r, c in self.whitePieces + self.blackPieces:
+            h ^= ZOBRIST_PIECES[self.board[r][c]][r][c]
+
+        h ^= ZOBRIST_CASTLE[self.castleRights]
+
+        if self.enPassantSquare is not None:
+            h ^= ZOBRIST_EN_PASSANT[self.enPassantSquare[1]]
+
+        if not self.whiteToMove:
+            h ^= ZOBRIST_BLACK_TO_MOVE
+
+        return h
+
+    def getEnPassantCol(self):
+        """Column of the pawn that has just made a double step, or None."""
+
+        return None if self.enPassantSquare is None else self.enPassantSquare[1]
+
+    def isRepetition(self, times=3):
+        """Whether the current position has occurred times times, this time included. Only positions since the last capture or pawn move can repeat."""
+
+        seen = 1
+
+        for back in range(2, min(self.halfmoveClock, len(self.stateLog)) + 1, 2):  # Positions with the same side to move
+            if self.stateLog[-back][4] == self.zobristHash:
+                seen += 1
+
+                if seen >= times:
+                    return True
+
+        return False
+
+    def isInsufficientMaterial(self):
+        """Whether neither side can checkmate any more: a king against a king with at most one knight or bishop, or bishops that all stand on squares of one color."""
+
+        bitboards = self.bitboards
+
+        if bitboards["wP"] | bitboards["bP"] | bitboards["wR"] | bitboards["bR"] | bitboards["wQ"] | bitboards["bQ"]:
+            return False
+
+        minors = bitboards["wN"] | bitboards["bN"] | bitboards["wB"] | bitboards["bB"]
+
+        if not minors & (minors - 1):
+            return True
+
+        if bitboards["wN"] | bitboards["bN"]:
+            return False
+
+        return minors & LIGHT_SQUARES in (0, minors)
 
     def getValidMoves(self):
         moves = {}
@@ -58,19 +574,10 @@ class Game:
                 if not moves[king]:
                     del moves[king]
             else:
-                direction = tuple(self.checks.keys())[0]
-                check = self.checks[direction]
-                piece = self.board[check[0]][check[1]]
-
-                validSquares = [check]
-
-                if piece[1] != "N":
-                    row, col = (king[0] + direction[0], king[1] + direction[1])
-                    while (row, col) != check:
-                        validSquares.append((row, col))
+                check = tuple(self.checks.values())[0]
 
-                        row += direction[0]
-                        col += direction[1]
+                # Capture the checking piece, or block the check
+                validSquares = SQUARE_BITS[check[0]][check[1]] | BETWEEN_MASKS[king[0] * 8 + king[1]][check[0] * 8 + check[1]]
 
                 moves = self.getAllPossibleMoves(ally, enemy, pieces, validSquares)
 
@@ -86,135 +593,71 @@ class Game:
 
         return moves
 
-    def checkChecks(self, ally, enemy, king, check=False):
-        for direction in ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)):  # Knight moves
-            checkRow, checkCol = king[0] + direction[0], king[1] + direction[1]
+    def checkChecks(self, ally, enemy, king):
+        square = king[0] * 8 + king[1]
+        bitboards = self.bitboards
+        occupied = self.occupancy["w"] | self.occupancy["b"]
 
-            if (0 <= checkRow <= 7) and (0 <= checkCol <= 7):
-                piece = self.board[checkRow][checkCol]
+        # Knights, pawns and the king can only attack the king from a fixed set of squares
+        for attackers in (KNIGHT_ATTACKS[square] & bitboards[enemy + "N"], PAWN_ATTACKS[ally][square] & bitboards[enemy + "P"], KING_ATTACKS[square] & bitboards[enemy + "K"]):
+            if attackers:
+                checkRow, checkCol = SQUARES[attackers.bit_length() - 1]
+                self.checks[(checkRow - king[0], checkCol - king[1])] = (checkRow, checkCol)
 
-                if piece == enemy + "N":
-                    if check:
-                        return True
-                    self.checks[direction] = (checkRow, checkCol)
-                    break
+        for directions, slider in ((ROOK_DIRECTIONS, "R"), (BISHOP_DIRECTIONS, "B")):
+            slidersMask = bitboards[enemy + slider] | bitboards[enemy + "Q"]
 
-        for direction in ((1, 0), (0, 1), (-1, 0), (0, -1)):  # Rook moves
-            checkRow, checkCol = king[0] + direction[0], king[1] + direction[1]
+            if not slidersMask:
+                continue
 
-            if (0 <= checkRow <= 7) and (0 <= checkCol <= 7):
-                piece = self.board[checkRow][checkCol]
+            for direction in directions:
+                sliders = RAY_MASKS[square][direction] & slidersMask
 
-                if piece[0] == enemy and piece[1] in ("R", "Q", "K"):
-                    if check:
-                        return True
-                    self.checks[direction] = (checkRow, checkCol)
+                if not sliders:  # Neither a check nor a pin is possible along this ray
                     continue
 
-                pin = None
-
-                while (0 <= checkRow <= 7) and (0 <= checkCol <= 7):
-                    piece = self.board[checkRow][checkCol]
-
-                    if piece[0] == enemy and piece[1] not in ("R", "Q"):
-                        break
-                    elif piece[0] == ally and not pin:
-                        if check:
-                            break
-                        pin = (checkRow, checkCol)
-                    elif pin and piece[0] == ally:
-                        break
-                    elif pin and piece[0] == enemy and piece[1] in ("R", "Q"):
-                        self.xRayChecks[pin] = (direction, (-direction[0], -direction[1]), piece[1], king)
-                        break
-                    elif piece[0] == enemy and piece[1] in ("R", "Q"):
-                        if check:
-                            return True
-                        self.checks[direction] = (checkRow, checkCol)
-                        break
-
-                    checkRow += direction[0]
-                    checkCol += direction[1]
-
-        for direction in ((-1, -1), (-1, 1)):  # Bishop moves upwards
-            checkRow, checkCol = king[0] + direction[0], king[1] + direction[1]
-
-            if (0 <= checkRow <= 7) and (0 <= checkCol <= 7):
-                piece = self.board[checkRow][checkCol]
-
-                if piece[0] == enemy and (piece[1] in ("B", "Q", "K") or (ally == "w" and piece[1] == "P")):
-                    if check:
-                        return True
-                    self.checks[direction] = (checkRow, checkCol)
-                    continue
-
-                pin = None
-
-                while (0 <= checkRow <= 7) and (0 <= checkCol <= 7):
-                    piece = self.board[checkRow][checkCol]
-
-                    if piece[0] == enemy and piece[1] not in ("B", "Q"):
-                        break
-                    elif piece[0] == ally and not pin:
-                        if check:
-                            break
-                        pin = (checkRow, checkCol)
-                    elif pin and piece[0] == ally:
-                        break
-                    elif pin and piece[0] == enemy and piece[1] in ("B", "Q"):
-                        self.xRayChecks[pin] = (direction, (-direction[0], -direction[1]), piece[1], king)
-                        break
-                    elif piece[0] == enemy and piece[1] in ("B", "Q"):
-                        if check:
-                            return True
-                        self.checks[direction] = (checkRow, checkCol)
-                        break
-
-                    checkRow += direction[0]
-                    checkCol += direction[1]
-
-        for direction in ((1, -1), (1, 1)):  # Bishop moves downwards
-            checkRow, checkCol = king[0] + direction[0], king[1] + direction[1]
-
-            if (0 <= checkRow <= 7) and (0 <= checkCol <= 7):
-                piece = self.board[checkRow][checkCol]
-
-                if piece[0] == enemy and (piece[1] in ("B", "Q", "K") or (ally == "b" and piece[1] == "P")):
-                    if check:
-                        return True
-                    self.checks[direction] = (checkRow, checkCol)
-                    continue
+                # Directions greater than (0, 0) run towards higher square indices, so the nearest slider is the lowest set bit
+                nearest = (sliders & -sliders).bit_length() - 1 if direction > (0, 0) else sliders.bit_length() - 1
+                blockers = BETWEEN_MASKS[square][nearest] & occupied
 
-                pin = None
-
-                while (0 <= checkRow <= 7) and (0 <= checkCol <= 7):
-                    piece = self.board[checkRow][checkCol]
-
-                    if piece[0] == enemy and piece[1] not in ("B", "Q"):
-                        break
-                    elif piece[0] == ally and not pin:
-                        if check:
-                            break
-                        pin = (checkRow, checkCol)
-                    elif pin and piece[0] == ally:
-                        break
-                    elif pin and piece[0] == enemy and piece[1] in ("B", "Q"):
-                        self.xRayChecks[pin] = (direction, (-direction[0], -direction[1]), piece[1], king)
-                        break
-                    elif piece[0] == enemy and piece[1] in ("B", "Q"):
-                        if check:
-                            return True
-                        self.checks[direction] = (checkRow, checkCol)
-                        break
-
-                    checkRow += direction[0]
-                    checkCol += direction[1]
-
-        if check:
-            return False
+                if not blockers:
+                    self.checks[direction] = SQUARES[nearest]
+                elif not blockers & (blockers - 1) and blockers & self.occupancy[ally]:
+                    self.xRayChecks[SQUARES[blockers.bit_length() - 1]] = (direction, (-direction[0], -direction[1]))  # The only directions the pinned piece may move in
 
         return True if self.checks else False
 
+    def isSquareAttacked(self, square, byColor):
+        """Whether a piece of byColor attacks square, given as (row, col). Only reads the bitboards, so the game state is never changed.
+
+        The other color's king does not block a ray, as a king stepping away from a slider along its line would still be in check."""
+
+        index = square[0] * 8 + square[1]
+        bitboards = self.bitboards
+        defender = "b" if byColor == "w" else "w"
+
+        if KNIGHT_ATTACKS[index] & bitboards[byColor + "N"] or KING_ATTACKS[index] & bitboards[byColor + "K"] or PAWN_ATTACKS[defender][index] & bitboards[byColor + "P"]:
+            return True
+
+        occupied = (self.occupancy["w"] | self.occupancy["b"]) & ~bitboards[defender + "K"]
+
+        for directions, slider in ((ROOK_DIRECTIONS, "R"), (BISHOP_DIRECTIONS, "B")):
+            slidersMask = bitboards[byColor + slider] | bitboards[byColor + "Q"]
+
+            if not slidersMask:
+                continue
+
+            for direction in directions:
+                sliders = RAY_MASKS[index][direction] & slidersMask
+
+                if sliders:
+                    nearest = (sliders & -sliders).bit_length() - 1 if direction > (0, 0) else sliders.bit_length() - 1
+
+                    if not BETWEEN_MASKS[index][nearest] & occupied:
+                        return True
+
+        return False
+
     def getAllPossibleMoves(self, ally, enemy, pieces, valid=False):
         moves = {}
 
@@ -236,225 +679,360 @@ class Game:
             moveAmount = -1
             startRow = 6
             enPassantRow = 3
-            enemyStart = 1
             king = self.whiteKing
         else:
             moveAmount = 1
             startRow = 1
             enPassantRow = 4
-            enemyStart = 6
             king = self.blackKing
 
         if self.board[r + moveAmount][c] == "--" and (not pin or (moveAmount, 0) in pin):
-            if not valid or (r + moveAmount, c) in valid:
+            if not valid or SQUARE_BITS[r + moveAmount][c] & valid:
                 moves[(r, c)].append((r + moveAmount, c))
 
-            if r == startRow and self.board[r + 2 * moveAmount][c] == "--" and (not valid or (r + 2 * moveAmount, c) in valid):
+            if r == startRow and self.board[r + 2 * moveAmount][c] == "--" and (not valid or SQUARE_BITS[r + 2 * moveAmount][c] & valid):
                 moves[(r, c)].append((r + 2 * moveAmount, c))
 
-        if c - 1 >= 0:
-            if self.board[r + moveAmount][c - 1][0] == enemy and (not pin or (moveAmount, -1) in pin) and (not valid or (r + moveAmount, c - 1) in valid):
-                moves[(r, c)].append((r + moveAmount, c - 1))
+        enPassantCol = self.getEnPassantCol() if r == enPassantRow else None
 
-            elif r == enPassantRow and self.board[enPassantRow][c - 1] == enemy + "P" and (not valid or (r + moveAmount, c - 1) in valid):
-                prevMove = self.moveLog[-1]
+        for d in (-1, 1):
+            if not 0 <= c + d <= 7 or (pin and (moveAmount, d) not in pin):
+                continue
 
-                if prevMove.pieceMoved == enemy + "P" and prevMove.startRow == enemyStart and prevMove.endRow == enPassantRow and prevMove.endCol == c - 1:
-                    if king[0] != r:
-                        moves[(r, c)].append((r + moveAmount, c - 1))
-                    else:
-                        d = int((c - king[1]) / abs(c - king[1]))
+            if self.board[r + moveAmount][c + d][0] == enemy and (not valid or SQUARE_BITS[r + moveAmount][c + d] & valid):
+                moves[(r, c)].append((r + moveAmount, c + d))
 
-                        checkCol = c + 2 * d if prevMove.endCol == c + d else c + d
+            # En passant also answers a check given by the pawn that is captured
+            elif enPassantCol == c + d and (not valid or (SQUARE_BITS[r + moveAmount][c + d] | SQUARE_BITS[r][c + d]) & valid) and not self.enPassantExposesKing(r, c, c + d, king, enemy):
+                moves[(r, c)].append((r + moveAmount, c + d))
 
-                        while 0 <= checkCol <= 7:
-                            piece = self.board[r][checkCol]
+    def enPassantExposesKing(self, r, c, capturedCol, king, enemy):
+        """Whether taking en passant would leave the king in check from a slider. Two pawns leave their squares at once, which the pins found by checkChecks do not account for."""
 
-                            if piece[0] == ally or (piece[0] == enemy and piece[1] not in ("R", "Q")):
-                                moves[(r, c)].append((r + moveAmount, c - 1))
-                            elif piece[0] == enemy and piece[1] in ("R", "Q"):
-                                break
+        square = king[0] * 8 + king[1]
+        targetRow = r - 1 if enemy == "b" else r + 1
+        occupied = (self.occupancy["w"] | self.occupancy["b"]) ^ SQUARE_BITS[r][c] ^ SQUARE_BITS[r][capturedCol] | SQUARE_BITS[targetRow][capturedCol]
 
-                            checkCol += d
+        for directions, slider in ((ROOK_DIRECTIONS, "R"), (BISHOP_DIRECTIONS, "B")):
+            slidersMask = self.bitboards[enemy + slider] | self.bitboards[enemy + "Q"]
 
-        if c + 1 <= 7:
-            if self.board[r + moveAmount][c + 1][0] == enemy and (not pin or (moveAmount, 1) in pin) and (not valid or (r + moveAmount, c + 1) in valid):
-                moves[(r, c)].append((r + moveAmount, c + 1))
+            if not slidersMask:
+                continue
 
-            elif r == enPassantRow and self.board[enPassantRow][c + 1] == enemy + "P" and (not valid or (r + moveAmount, c + 1) in valid):
-                prevMove = self.moveLog[-1]
+            for direction in directions:
+                sliders = RAY_MASKS[square][direction] & slidersMask
 
-                if prevMove.pieceMoved == enemy + "P" and prevMove.startRow == enemyStart and prevMove.endRow == enPassantRow and prevMove.endCol == c + 1:
-                    if king[0] != r:
-                        moves[(r, c)].append((r + moveAmount, c + 1))
-                    else:
-                        d = int((c - king[1]) / abs(c - king[1]))
+                if sliders:
+                    nearest = (sliders & -sliders).bit_length() - 1 if direction > (0, 0) else sliders.bit_length() - 1
 
-                        checkCol = c + 2 * d if prevMove.endCol == c + d else c + d
-
-                        while 0 <= checkCol <= 7:
-                            piece = self.board[r][checkCol]
-
-                            if piece[0] == ally or (piece[0] == enemy and piece[1] not in ("R", "Q")):
-                                moves[(r, c)].append((r + moveAmount, c + 1))
-                            elif piece[0] == enemy and piece[1] in ("R", "Q"):
-                                break
+                    if not BETWEEN_MASKS[square][nearest] & occupied:
+                        return True
 
-                            checkCol += d
+        return False
 
     def getKnightMoves(self, r, c, moves, ally, enemy, pin, valid):
         if pin:
             return
 
-        for direction in ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)):
-            endRow = r + direction[0]
-            endCol = c + direction[1]
+        targets = KNIGHT_ATTACKS[r * 8 + c] & ~self.occupancy[ally]
+        if valid:
+            targets &= valid
+
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
 
-            if 0 <= endRow <= 7 and 0 <= endCol <= 7 and (not valid or (endRow, endCol) in valid):
-                piece = self.board[endRow][endCol]
-                if piece[0] in (enemy, "-"):
-                    moves[(r, c)].append((endRow, endCol))
+            moves[(r, c)].append(SQUARES[bit.bit_length() - 1])
+
+    def getSlidingMoves(self, r, c, moves, ally, pin, valid, directions):
+        square = r * 8 + c
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        notAlly = ~self.occupancy[ally]
+        if valid:
+            notAlly &= valid  # Only squares that answer the check
+
+        for direction in directions:
+            if pin and direction not in pin:
+                continue
+
+            ray = RAY_MASKS[square][direction]
+            blockers = ray & occupied
+
+            if blockers:
+                # Directions greater than (0, 0) run towards higher square indices, so the nearest blocker is the lowest set bit
+                blocker = (blockers & -blockers).bit_length() - 1 if direction > (0, 0) else blockers.bit_length() - 1
+                ray ^= RAY_MASKS[blocker][direction]
+
+            targets = ray & notAlly
+
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+
+                moves[(r, c)].append(SQUARES[bit.bit_length() - 1])
 
     def getBishopMoves(self, r, c, moves, ally, enemy, pin, valid):
-        for direction in ((1, 1), (-1, 1), (1, -1), (-1, -1)):
-            if not pin or direction in pin:
-                endRow, endCol = r + direction[0], c + direction[1]
-
-                while (0 <= endRow <= 7) and (0 <= endCol <= 7):
-                    piece = self.board[endRow][endCol]
-
-                    if piece[0] == ally:
-                        break
-                    elif piece[0] == enemy:
-                        if not valid or (endRow, endCol) in valid:
-                            moves[(r, c)].append((endRow, endCol))
-                        break
-                    else:
-                        if not valid or (endRow, endCol) in valid:
-                            moves[(r, c)].append((endRow, endCol))
-
-                        endRow += direction[0]
-                        endCol += direction[1]
+        self.getSlidingMoves(r, c, moves, ally, pin, valid, BISHOP_DIRECTIONS)
 
     def getRookMoves(self, r, c, moves, ally, enemy, pin, valid):
-        for direction in ((1, 0), (0, 1), (-1, 0), (0, -1)):
-            if not pin or direction in pin:
-                endRow, endCol = r + direction[0], c + direction[1]
-
-                while (0 <= endRow <= 7) and (0 <= endCol <= 7):
-                    piece = self.board[endRow][endCol]
-
-                    if piece[0] == ally:
-                        break
-                    elif piece[0] == enemy:
-                        if not valid or (endRow, endCol) in valid:
-                            moves[(r, c)].append((endRow, endCol))
-                        break
-                    else:
-                        if not valid or (endRow, endCol) in valid:
-                            moves[(r, c)].append((endRow, endCol))
-
-                        endRow += direction[0]
-                        endCol += direction[1]
+        self.getSlidingMoves(r, c, moves, ally, pin, valid, ROOK_DIRECTIONS)
 
     def getQueenMoves(self, r, c, moves, ally, enemy, pin, valid):
-        self.getRookMoves(r, c, moves, ally, enemy, pin, valid)
-        self.getBishopMoves(r, c, moves, ally, enemy, pin, valid)
+        self.getSlidingMoves(r, c, moves, ally, pin, valid, KING_DIRECTIONS)
 
     def getKingMoves(self, r, c, moves, ally, enemy, pin=None, valid=None):
-        for direction in ((1, 0), (-1, 0), (1, 1), (-1, 1), (1, -1), (-1, -1)):
-            endRow, endCol = r + direction[0], c + direction[1]
+        targets = KING_ATTACKS[r * 8 + c] & ~self.occupancy[ally]
+
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+
+            end = SQUARES[bit.bit_length() - 1]
+            if not self.isSquareAttacked(end, enemy):
+                moves[(r, c)].append(end)
+
+        # Castling is also offered as the king moving onto its own rook. The square the king passes over must be a valid king move
+        if not self.inCheck and c == 4:
+            if self.castleRights & CASTLE_RIGHTS.get((r, 7), 0) and self.board[r][5] == self.board[r][6] == "--" and (r, 5) in moves[(r, c)] and not self.isSquareAttacked((r, 6), enemy):
+                moves[(r, c)].append((r, 6))
+                moves[(r, c)].append((r, 7))
+
+            if self.castleRights & CASTLE_RIGHTS.get((r, 0), 0) and self.board[r][3] == self.board[r][2] == self.board[r][1] == "--" and (r, 3) in moves[(r, c)] and not self.isSquareAttacked((r, 2), enemy):
+                moves[(r, c)].append((r, 2))
+                moves[(r, c)].append((r, 0))
+
+    def getMoveCodes(self):
+        """The valid moves as packed ints, see encodeMove. Like getValidMoves, this updates inCheck, checkmate and stalemate.
+
+        Castling is only listed once, whereas getValidMoves also offers it as the king moving onto its own rook."""
+
+        board = self.board
+        rook = "wR" if self.whiteToMove else "bR"
+
+        return [encodeMove(start, end, board) for start, ends in self.getValidMoves().items() for end in ends if board[end[0]][end[1]] != rook]
+
+    def generateMoveCodes(self, hashMove=None, order=None):
+        """Generator over the valid moves as packed ints, in stages: hashMove if it is valid, then the captures and promotions, then the quiet moves.
+
+        A stage is only generated once every move of the stages before it has been taken, so a search that stops early never generates the rest.
+        order, if given, is called with the moves of each stage and returns them in the order to yield them.
+        This updates inCheck, but not checkmate or stalemate: the caller knows there is no valid move when nothing was yielded."""
+
+        ally, enemy, king = ("w", "b", self.whiteKing) if self.whiteToMove else ("b", "w", self.blackKing)
+
+        self.checks, self.xRayChecks = ({}, {})
+        self.inCheck = inCheck = self.checkChecks(ally, enemy, king)
+
+        # The caller makes moves between two yields, which overwrites these, so they are put back before every stage
+        checks, pins = self.checks, self.xRayChecks
+
+        if inCheck:  # Few moves answer a check, so they are all generated at once
+            codes = self.getMoveCodes()
+            stages = [code for code in codes if code & (MOVE_CAPTURE | MOVE_EN_PASSANT | MOVE_PROMOTION)], [code for code in codes if not code & (MOVE_CAPTURE | MOVE_EN_PASSANT | MOVE_PROMOTION)]
+
+            if hashMove not in codes:
+                hashMove = None
+        else:
+            stages = None
+
+            if hashMove is not None and not self.isValidMoveCode(hashMove):
+                hashMove = None
+
+        if hashMove is not None:
+            yield hashMove
+
+        for stage in (0, 1):
+            if stages:
+                codes = stages[stage]
+            else:
+                self.checks, self.xRayChecks, self.inCheck = checks, pins, inCheck
+                codes = self.getCaptureCodes(False) if stage == 0 else self.getQuietCodes()
+
+            if order is not None:
+                codes = order(codes)
+
+            for code in codes:
+                if code != hashMove:
+                    yield code
+
+        self.checks, self.xRayChecks, self.inCheck = checks, pins, inCheck
+
+    def isValidMoveCode(self, code):
+        """Whether the packed move is one of the valid moves, generating the moves of its piece only. checks and xRayChecks must be up to date, and the side to move not in check."""
+
+        r, c = SQUARES[code & 63]
+        piece = self.board[r][c]
+
+        if piece[0] != ("w" if self.whiteToMove else "b"):
+            return False
+
+        ally, enemy = ("w", "b") if self.whiteToMove else ("b", "w")
+        moves = {(r, c): []}
+
+        self.moveFunctions[piece[1]](r, c, moves, ally, enemy, self.xRayChecks.get((r, c), None), False)
 
-            if 0 <= endRow <= 7 and 0 <= endCol <= 7:
-                piece = self.board[endRow][endCol]
-                if piece[0] != ally:
-                    self.board[r][c] = "--"
-                    self.board[endRow][endCol] = ally+"K"
+        return any(encodeMove((r, c), end, self.board) == code for end in moves[(r, c)])
 
-                    if not self.checkChecks(ally, enemy, (endRow, endCol), True):
-                        moves[(r, c)].append((endRow, endCol))
+    def getQuietCodes(self):
+        """The valid moves that neither capture nor promote, as packed ints. checks and xRayChecks must be up to date, and the side to move not in check."""
 
-                    self.board[r][c] = ally + "K"
-                    self.board[endRow][endCol] = piece
+        ally, enemy, pieces = ("w", "b", self.whitePieces) if self.whiteToMove else ("b", "w", self.blackPieces)
+        board = self.board
+        empty = ~(self.occupancy["w"] | self.occupancy["b"]) & ((1 << 64) - 1)
+
+        if not empty:
+            return []
+
+        # Limiting the targets to the empty squares leaves out most captures. King moves, en passant and promotions are filtered by their flags
+        codes = [encodeMove(start, end, board) for start, ends in self.getAllPossibleMoves(ally, enemy, pieces, empty).items() for end in ends if board[end[0]][end[1]][0] != ally]
+
+        return [code for code in codes if not code & (MOVE_CAPTURE | MOVE_EN_PASSANT | MOVE_PROMOTION)]
+
+    def getCaptureCodes(self, findChecks=True):
+        """Only the valid captures and promotions, as packed ints like getMoveCodes, without generating the quiet moves.
+
+        This updates inCheck, but not checkmate or stalemate. In check, the captures and promotions among the valid moves are returned.
+        With findChecks=False, checks, xRayChecks and inCheck are taken as they are."""
+
+        ally, enemy, king, forward, promotionRow = ("w", "b", self.whiteKing, -1, 0) if self.whiteToMove else ("b", "w", self.blackKing, 1, 7)
+
+        if findChecks:
+            self.checks, self.xRayChecks = ({}, {})
+            self.inCheck = self.checkChecks(ally, enemy, king)
+
+        if self.inCheck:
+            return [code for code in self.getMoveCodes() if code & (MOVE_CAPTURE | MOVE_EN_PASSANT | MOVE_PROMOTION)]
 
-        # ((0, 1), (0, -1))
+        bitboards = self.bitboards
+        enemies = self.occupancy[enemy]
+        occupied = self.occupancy[ally] | enemies
+        pins = self.xRayChecks
 
-        if c + 1 <= 7:  # (0, 1)
-            piece = self.board[r][c + 1]
-            if piece[0] != ally:
-                self.board[r][c] = "--"
-                self.board[r][c + 1] = ally + "K"
+        codes = []
 
-                if not self.checkChecks(ally, enemy, (r, c + 1), True):
-                    moves[(r, c)].append((r, c + 1))
+        for r, c in bitboardSquares(bitboards[ally + "P"]):
+            start = r * 8 + c
+            pin = pins.get((r, c))
+            promotion = MOVE_PROMOTION if r + forward == promotionRow else 0
 
-                    if not self.inCheck and piece == "--" and c == 4 and self.board[r][c + 2] == "--" and (r, 7) in self.castlePossible[ally]:
-                        self.board[r][c + 1] = "--"
-                        self.board[r][c + 2] = ally + "K"
+            targets = PAWN_ATTACKS[ally][start] & enemies
 
-                        if not self.checkChecks(ally, enemy, (r, c + 2), True):
-                            moves[(r, c)].append((r, c + 2))
-                            moves[(r, c)].append((r, c + 3))
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
 
-                        self.board[r][c + 1] = ally + "K"
-                        self.board[r][c + 2] = "--"
+                end = bit.bit_length() - 1
+                if not pin or (forward, (end & 7) - c) in pin:
+                    codes.append(start | end << 6 | MOVE_CAPTURE | promotion)
 
-                self.board[r][c] = ally + "K"
-                self.board[r][c + 1] = piece
+            if promotion and self.board[r + forward][c] == "--" and (not pin or (forward, 0) in pin):
+                codes.append(start | (start + 8 * forward) << 6 | MOVE_PROMOTION)
 
-        if 0 <= c - 1:  # (0, -1)
-            piece = self.board[r][c - 1]
-            if piece[0] != ally:
-                self.board[r][c] = "--"
-                self.board[r][c - 1] = ally + "K"
+        enPassantCol = self.getEnPassantCol()
 
-                if not self.checkChecks(ally, enemy, (r, c - 1), True):
-                    moves[(r, c)].append((r, c - 1))
+        if enPassantCol is not None:
+            r = 3 if self.whiteToMove else 4
 
-                    if not self.inCheck and piece == "--" and c == 4 and self.board[r][c - 2] == "--" and self.board[r][c - 3] == "--" and (r, 0) in self.castlePossible[ally]:
-                        self.board[r][c - 1] = "--"
-                        self.board[r][c - 2] = ally + "K"
+            for c in (enPassantCol - 1, enPassantCol + 1):
+                if 0 <= c <= 7 and self.board[r][c] == ally + "P":
+                    pin = pins.get((r, c))
 
-                        if not self.checkChecks(ally, enemy, (r, c - 2), True):
-                            moves[(r, c)].append((r, c - 2))
-                            moves[(r, c)].append((r, c - 4))
+                    if (not pin or (forward, enPassantCol - c) in pin) and not self.enPassantExposesKing(r, c, enPassantCol, king, enemy):
+                        codes.append(r * 8 + c | ((r + forward) * 8 + enPassantCol) << 6 | MOVE_EN_PASSANT)
 
-                        self.board[r][c - 1] = ally + "K"
-                        self.board[r][c - 2] = "--"
+        for r, c in bitboardSquares(bitboards[ally + "N"]):
+            if (r, c) in pins:
+                continue
 
-                self.board[r][c] = ally + "K"
-                self.board[r][c - 1] = piece
+            start = r * 8 + c
+            targets = KNIGHT_ATTACKS[start] & enemies
+
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+
+                codes.append(start | (bit.bit_length() - 1) << 6 | MOVE_CAPTURE)
+
+        for piece, directions in (("B", BISHOP_DIRECTIONS), ("R", ROOK_DIRECTIONS), ("Q", KING_DIRECTIONS)):
+            for r, c in bitboardSquares(bitboards[ally + piece]):
+                start = r * 8 + c
+                pin = pins.get((r, c))
+
+                for direction in directions:
+                    if pin and direction not in pin:
+                        continue
+
+                    blockers = RAY_MASKS[start][direction] & occupied
+
+                    if blockers:
+                        blocker = (blockers & -blockers).bit_length() - 1 if direction > (0, 0) else blockers.bit_length() - 1
+
+                        if enemies >> blocker & 1:
+                            codes.append(start | blocker << 6 | MOVE_CAPTURE)
+
+        start = king[0] * 8 + king[1]
+        targets = KING_ATTACKS[start] & enemies
+
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+
+            end = bit.bit_length() - 1
+            if not self.isSquareAttacked(SQUARES[end], enemy):
+                codes.append(start | end << 6 | MOVE_CAPTURE)
+
+        return codes
 
     def makeMove(self, move):
+        if move.__class__ is int:
+            move = Move.fromCode(move, self.board)
+
+        self.stateLog.append((self.castleRights, self.enPassantSquare, self.halfmoveClock, move.pieceCaptured, self.zobristHash, self.material["w"], self.material["b"], self.positionalScore))
+
+        h = self.zobristHash
+        positionalScore = self.positionalScore - POSITION_SCORES[move.pieceMoved][move.startRow][move.startCol]
+
+        if self.enPassantSquare is not None:
+            h ^= ZOBRIST_EN_PASSANT[self.enPassantSquare[1]]
+
+        h ^= ZOBRIST_PIECES[move.pieceMoved][move.startRow][move.startCol]
+        self.togglePiece(move.pieceMoved, move.startRow, move.startCol)
+        if move.pieceCaptured != "--":
+            h ^= ZOBRIST_PIECES[move.pieceCaptured][move.endRow][move.endCol]
+            self.togglePiece(move.pieceCaptured, move.endRow, move.endCol)
+
+            self.material[move.pieceCaptured[0]] -= PIECE_VALUES[move.pieceCaptured]
+            positionalScore -= POSITION_SCORES[move.pieceCaptured][move.endRow][move.endCol]
+
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
 
-        allyPieces, enemyPieces, ally, enemy, castle, row = (self.whitePieces, self.blackPieces, "w", "b", True, 7) if self.whiteToMove else (self.blackPieces, self.whitePieces, "b", "w", False, 0)
+        ally, enemy, row = ("w", "b", 7) if self.whiteToMove else ("b", "w", 0)
 
         if move.promotion:
             self.board[move.endRow][move.endCol] = move.pieceMoved[0] + "Q"
-        elif move.pieceMoved == "wP" and move.startRow == 3 and move.startCol != move.endCol and move.pieceCaptured == "--" and self.board[3][move.endCol] == "bP" and self.moveLog:
-            prevMove = self.moveLog[-1]
+        elif move.pieceMoved[1] == "P" and (move.endRow, move.endCol) == self.enPassantSquare:
+            # The captured pawn stands beside the start square
+            move.enPassant = True
+            self.board[move.startRow][move.endCol] = "--"
+            h ^= ZOBRIST_PIECES[enemy + "P"][move.startRow][move.endCol]
+            self.togglePiece(enemy + "P", move.startRow, move.endCol)
+            self.material[enemy] -= PIECE_VALUES[enemy + "P"]
+            positionalScore -= POSITION_SCORES[enemy + "P"][move.startRow][move.endCol]
 
-            if prevMove.pieceMoved == "bP" and prevMove.startRow == 1 and prevMove.startCol == move.endCol:
-                move.enPassant = True
-                self.board[3][move.endCol] = "--"
-                self.blackPieces.remove((3, move.endCol))
-        elif move.pieceMoved == "bP" and move.startRow == 4 and move.startCol != move.endCol and move.pieceCaptured == "--" and self.board[4][move.endCol] == "wP" and self.moveLog:
-            prevMove = self.moveLog[-1]
+        piecePlaced = self.board[move.endRow][move.endCol]
 
-            if prevMove.pieceMoved == "wP" and prevMove.startRow == 6 and prevMove.startCol == move.endCol:
-                move.enPassant = True
-                self.board[4][move.endCol] = "--"
-                self.whitePieces.remove((4, move.endCol))
+        h ^= ZOBRIST_PIECES[piecePlaced][move.endRow][move.endCol]
+        self.togglePiece(piecePlaced, move.endRow, move.endCol)
 
-        if move.pieceMoved[1] == "R" and (move.startRow, move.startCol) in self.castlePossible[ally]:
-            move.castlePossible = deepcopy(self.castlePossible)
-            self.castlePossible[ally].remove((move.startRow, move.startCol))
+        positionalScore += POSITION_SCORES[piecePlaced][move.endRow][move.endCol]
+        if move.promotion:
+            self.material[ally] += PIECE_VALUES[piecePlaced] - PIECE_VALUES[move.pieceMoved]
 
-        if move.pieceCaptured[1] == "R" and (move.endRow, move.endCol) in self.castlePossible[enemy]:
-            move.castlePossible = deepcopy(self.castlePossible)
-            self.castlePossible[enemy].remove((move.endRow, move.endCol))
+        castleRights = self.castleRights & CASTLE_RIGHTS_KEPT[move.startRow * 8 + move.startCol] & CASTLE_RIGHTS_KEPT[move.endRow * 8 + move.endCol]
+        if castleRights != self.castleRights:
+            h ^= ZOBRIST_CASTLE[self.castleRights] ^ ZOBRIST_CASTLE[castleRights]
+            self.castleRights = castleRights
 
         if move.pieceMoved[1] == "K":
             if move.castle:
@@ -463,27 +1041,40 @@ class Game:
                 if move.endCol == 6:
                     self.board[row][7] = "--"
                     self.board[row][5] = ally+"R"
-                    allyPieces.append((row, 5))
-                    allyPieces.remove((row, 7))
+                    h ^= ZOBRIST_PIECES[ally + "R"][row][7] ^ ZOBRIST_PIECES[ally + "R"][row][5]
+                    self.togglePiece(ally + "R", row, 7)
+                    self.togglePiece(ally + "R", row, 5)
+                    positionalScore += POSITION_SCORES[ally + "R"][row][5] - POSITION_SCORES[ally + "R"][row][7]
                 else:
                     self.board[row][0] = "--"
                     self.board[row][3] = ally+"R"
-                    allyPieces.append((row, 3))
-                    allyPieces.remove((row, 0))
+                    h ^= ZOBRIST_PIECES[ally + "R"][row][0] ^ ZOBRIST_PIECES[ally + "R"][row][3]
+                    self.togglePiece(ally + "R", row, 0)
+                    self.togglePiece(ally + "R", row, 3)
+                    positionalScore += POSITION_SCORES[ally + "R"][row][3] - POSITION_SCORES[ally + "R"][row][0]
 
             if self.whiteToMove:
                 self.whiteKing = (move.endRow, move.endCol)
             else:
                 self.blackKing = (move.endRow, move.endCol)
 
-            if self.castlePossible[ally]:
-                move.castlePossible = deepcopy(self.castlePossible)
-            self.castlePossible[ally] = []
+        if move.pieceMoved[1] == "P":
+            self.halfmoveClock = 0
 
-        allyPieces.append((move.endRow, move.endCol))
-        allyPieces.remove((move.startRow, move.startCol))
-        if move.pieceCaptured[0] == enemy:
-            enemyPieces.remove((move.endRow, move.endCol))
+            if abs(move.startRow - move.endRow) == 2:
+                self.enPassantSquare = ((move.startRow + move.endRow) // 2, move.endCol)
+                h ^= ZOBRIST_EN_PASSANT[move.endCol]
+            else:
+                self.enPassantSquare = None
+        else:
+            self.halfmoveClock = 0 if move.pieceCaptured != "--" else self.halfmoveClock + 1
+            self.enPassantSquare = None
+
+        self.zobristHash = h ^ ZOBRIST_BLACK_TO_MOVE
+        self.positionalScore = positionalScore
+
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
 
         self.moveLog.append(move)
 
@@ -493,19 +1084,24 @@ class Game:
 
         self.whiteToMove = not self.whiteToMove
 
-        self.whitePieces.sort()
-        self.blackPieces.sort(reverse=True)
-
     def undoMove(self):
         if not self.moveLog:
             return
 
+        if self.moveLog[-1] is None:
+            self.undoNullMove()
+            return
+
         move = self.moveLog.pop()
+        self.castleRights, self.enPassantSquare, self.halfmoveClock, pieceCaptured, self.zobristHash, self.material["w"], self.material["b"], self.positionalScore = self.stateLog.pop()
 
-        allyPieces, enemyPieces, ally, enemy, castle, row = (self.whitePieces, self.blackPieces, "w", "b", True, 3) if not self.whiteToMove else (self.blackPieces, self.whitePieces, "b", "w", False, 4)
+        ally, enemy = ("w", "b") if not self.whiteToMove else ("b", "w")
+
+        self.togglePiece(self.board[move.endRow][move.endCol], move.endRow, move.endCol)
+        self.togglePiece(move.pieceMoved, move.startRow, move.startCol)
 
         self.board[move.startRow][move.startCol] = move.pieceMoved
-        self.board[move.endRow][move.endCol] = move.pieceCaptured
+        self.board[move.endRow][move.endCol] = pieceCaptured
 
         if move.pieceMoved[1] == "K":
             if not self.whiteToMove:
@@ -516,38 +1112,68 @@ class Game:
             if move.castle:
                 if move.endCol == 6:
                     self.board[move.endRow][5], self.board[move.endRow][7] = "--", ally + "R"
-                    allyPieces.remove((move.endRow, 5))
-                    allyPieces.append((move.endRow, 7))
+                    self.togglePiece(ally + "R", move.endRow, 5)
+                    self.togglePiece(ally + "R", move.endRow, 7)
                 else:
-                    self.board[move.endRow][3], self.board[move.endRow][0] = "--", move.pieceMoved[0] + "R"
-                    allyPieces.remove((move.endRow, 3))
-                    allyPieces.append((move.endRow, 0))
-            if move.castlePossible and move.castlePossible[ally]:
-                self.castlePossible = deepcopy(move.castlePossible)
+                    self.board[move.endRow][3], self.board[move.endRow][0] = "--", ally + "R"
+                    self.togglePiece(ally + "R", move.endRow, 3)
+                    self.togglePiece(ally + "R", move.endRow, 0)
         elif move.enPassant:
-            self.board[row][move.endCol] = enemy+"P"
-            enemyPieces.append((row, move.endCol))
-        elif move.castlePossible and move.pieceMoved[1] == "R" and move.castlePossible[ally]:
-            self.castlePossible = deepcopy(move.castlePossible)
+            self.board[move.startRow][move.endCol] = enemy + "P"
+            self.togglePiece(enemy + "P", move.startRow, move.endCol)
+
+        if pieceCaptured != "--":
+            self.togglePiece(pieceCaptured, move.endRow, move.endCol)
+
+        self.whiteToMove = not self.whiteToMove
+
+        if not self.whiteToMove:
+            self.fullmoveNumber -= 1
+
+        self.checkmate = False
+        self.stalemate = False
+
+    def makeNullMove(self):
+        """Pass the turn without moving, for the null move pruning of the search. It is logged as None in moveLog, so undoMove takes it back too."""
+
+        self.stateLog.append((self.castleRights, self.enPassantSquare, self.halfmoveClock, "--", self.zobristHash, self.material["w"], self.material["b"], self.positionalScore))
+
+        if self.enPassantSquare is not None:
+            self.zobristHash ^= ZOBRIST_EN_PASSANT[self.enPassantSquare[1]]
+            self.enPassantSquare = None
 
-        if move.pieceCaptured[0] == enemy:
-            enemyPieces.append((move.endRow, move.endCol))
-            if move.castlePossible and move.pieceCaptured[1] == "R" and move.castlePossible[enemy]:
-                self.castlePossible = deepcopy(move.castlePossible)
+        self.zobristHash ^= ZOBRIST_BLACK_TO_MOVE
+        self.halfmoveClock += 1
 
-        allyPieces.append((move.startRow, move.startCol))
-        allyPieces.remove((move.endRow, move.endCol))
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
+
+        self.moveLog.append(None)
+
+        self.inCheck = False
+        self.checks = {}
+        self.xRayChecks = {}
 
         self.whiteToMove = not self.whiteToMove
 
-        self.whitePieces.sort()
-        self.blackPieces.sort(reverse=True)
+    def undoNullMove(self):
+        self.moveLog.pop()
+        self.castleRights, self.enPassantSquare, self.halfmoveClock, pieceCaptured, self.zobristHash, self.material["w"], self.material["b"], self.positionalScore = self.stateLog.pop()
+
+        self.whiteToMove = not self.whiteToMove
+
+        if not self.whiteToMove:
+            self.fullmoveNumber -= 1
 
         self.checkmate = False
         self.stalemate = False
 
 
 class Move:
+    """A move, as played on a board. Once made, it is kept in Game.moveLog, and the state it cannot restore by itself in Game.stateLog."""
+
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "promotion", "castle", "enPassant", "check")
+
     def __init__(self, start, end, board):
         self.startRow = start[0]
         self.startCol = start[1]
@@ -567,8 +1193,28 @@ class Move:
         if self.castle:
             self.endCol = 6 if self.endCol in (6, 7) else 2
 
-        self.castlePossible = False
-
         self.enPassant = False
 
         self.check = False
+
+    @classmethod
+    def fromCode(cls, code, board):
+        return cls(SQUARES[code & 63], SQUARES[code >> 6 & 63], board)
+
+    @property
+    def code(self):
+        """The move packed into an int, see encodeMove."""
+
+        code = self.startRow * 8 + self.startCol | (self.endRow * 8 + self.endCol) << 6
+
+        if self.castle:
+            code |= MOVE_CASTLE
+        elif self.pieceCaptured != "--":
+            code |= MOVE_CAPTURE
+        elif self.pieceMoved[1] == "P" and self.startCol != self.endCol:
+            code |= MOVE_EN_PASSANT
+
+        if self.promotion:
+            code |= MOVE_PROMOTION
+
+        return code
@@ -1,6 +1,8 @@
 # Main driver file. Handling user-input and displaying the current game-state.
 
 import pygame as p
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from Engine import *
 from AI import *
 
@@ -10,6 +12,9 @@ SQUARE_SIZE = HEIGHT // DIMENSIONS
 
 MAX_FPS = 20
 
+PONDER = True  # Let the AI think on the human's time about the reply it expects
+SHOW_SEARCH_STATS = True  # Print the statistics of every search of the AI to the console
+
 IMAGES = {}
 
 
@@ -86,6 +91,26 @@ def highlightSquares(screen, squareSelected, validMoves, checks, king, last):
             screen.blit(s, (move[1] * SQUARE_SIZE, move[0] * SQUARE_SIZE))
 
 
+def drawThinking(screen):
+    font = p.font.SysFont("inkfree", 20, False, False)
+    textObject = font.render("Thinking" + "." * (p.time.get_ticks() // 400 % 4), 0, p.Color("Blue"))
+    screen.blit(textObject, (4, 2))
+
+
+def thinkAIMove(position, time_limit=TIME_LIMIT):
+    """Runs on the AI thread, on a copy of the game-state, so that the window keeps handling events while the AI searches. Returns (move, SearchStats)."""
+
+    searchStop.clear()
+
+    return findAIMove(position, time_limit)
+
+
+def stopAIThinking(aiThinking):
+    if aiThinking is not None:
+        aiThinking.cancel()
+        searchStop.set()
+
+
 def drawText(screen, text):
     font = p.font.SysFont("inkfree", 32, False, False)
     textObject = font.render(text, 0, p.Color("Red"))
@@ -116,10 +141,17 @@ if __name__ == "__main__":
 
     gameOver = False
 
+    aiExecutor = ThreadPoolExecutor(max_workers=1)
+    aiThinking = None  # Future of the running AI search
+    pondering = None  # Future of the search on the position after the human's expected move
+    ponderHash = ponderStart = None
+
     running = True
     while running:
         for e in p.event.get():
             if e.type == p.QUIT:
+                stopAIThinking(aiThinking)
+                stopAIThinking(pondering)
                 running = False
                 break
 
@@ -145,6 +177,17 @@ if __name__ == "__main__":
                                 game_state.makeMove(move)
                                 moveMade = True
                                 prevSquareSelected = None
+
+                                if pondering is not None:
+                                    game_state.getValidMoves()
+
+                                    # Ponder hit: keep the search, with the time already spent counted. Not if the move ended the game, leaving the search no move to give
+                                    if game_state.zobristHash == ponderHash and (pondering.running() or pondering.done()) and not (game_state.checkmate or game_state.stalemate):
+                                        ponderHit(max(0, TIME_LIMIT - (p.time.get_ticks() - ponderStart) / 1000))
+                                        aiThinking = pondering
+                                    else:
+                                        stopAIThinking(pondering)
+                                    pondering = None
                             elif squareSelected in tuple(game_state.validMoves.keys()):
                                 prevSquareSelected = squareSelected
                             else:
@@ -152,20 +195,54 @@ if __name__ == "__main__":
 
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_BACKSPACE:
-                    game_state.undoMove()
-                    if not (playerWhite and playerBlack):
+                    stopAIThinking(pondering)
+                    pondering = None
+
+                    if aiThinking is not None:  # Cancel the search and take back the move it was answering
+                        stopAIThinking(aiThinking)
+                        aiThinking = None
+                        game_state.undoMove()
+                    else:
                         game_state.undoMove()
+                        if not (playerWhite and playerBlack):
+                            game_state.undoMove()
                     moveMade = True
                     gameOver = False
 
                 elif e.key == p.K_ESCAPE:
+                    stopAIThinking(aiThinking)
+                    stopAIThinking(pondering)
                     running = False
                     break
 
-        if not human and not gameOver:
-            start, end = findAIMove(game_state)
-            game_state.makeMove(Move(start, end, game_state.board))
-            moveMade = True
+        if not human and not gameOver and aiThinking is None:
+            aiThinking = aiExecutor.submit(thinkAIMove, deepcopy(game_state))
+
+        if aiThinking is not None and aiThinking.done():
+            move, stats = aiThinking.result()
+            aiThinking = None
+
+            if SHOW_SEARCH_STATS:
+                print(stats)
+
+            if move is not None:  # None only for a position where the game is already over
+                start, end = move
+                game_state.makeMove(Move(start, end, game_state.board))
+                moveMade = True
+
+                # The human's reply expected by the principal variation of the search, or else by the transposition table
+                if len(stats.pv) > 1 and decodeMove(stats.pv[0]) == (start, end):
+                    ponderMove = decodeMove(stats.pv[1])
+                else:
+                    ponderMove = getPonderMove(game_state)
+
+                if PONDER and ponderMove is not None and ((game_state.whiteToMove and playerWhite) or (not game_state.whiteToMove and playerBlack)):
+                    position = deepcopy(game_state)
+                    position.makeMove(Move(ponderMove[0], ponderMove[1], position.board))
+
+                    ponderHash = position.zobristHash
+                    ponderStart = p.time.get_ticks()
+                    pondering = aiExecutor.submit(thinkAIMove, position, None)
 
         if moveMade:
             game_state.getValidMoves()
@@ -188,5 +265,10 @@ if __name__ == "__main__":
             gameOver = True
             drawText(screen, "Draw by STALEMATE")
 
+        if aiThinking is not None:
+            drawThinking(screen)
+
         clock.tick(MAX_FPS)
-        p.display.flip()
\ No newline at end of file
+        p.display.flip()
+
+    aiExecutor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,282 @@
+# Self-play matches: two engine settings of AI.py play each other over many games, spread over one process per core.
+# Runs without pygame, e.g. "python Match.py alphabeta:depth=3 negamax:depth=2 --games 200". Each opening is played twice, with the colors swapped.
+# A setting is an algorithm, alphabeta, negamax, minmax, greedy or random, with options such as depth=3, time=0.5 or positional=0.2 (see AI.positionalWeight).
+
+import math
+import multiprocessing
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import AI
+from Analysis import parseLine
+from Engine import Game, Move, FIFTY_MOVE_PLIES, START_FEN
+from Pgn import formatGame, readGames
+
+OPENING_PLIES = 4  # Random moves played from the starting position when no openings are given
+MAX_OPENING_ATTEMPTS = 100
+
+ALGORITHMS = ("alphabeta", "negamax", "minmax", "greedy", "random")
+
+
+class Player:
+    """An engine setting, parsed from e.g. "alphabeta:depth=4,time=0.5". Each player keeps its own transposition table."""
+
+    def __init__(self, spec, depth=AI.MAX_DEPTH, time_limit=AI.TIME_LIMIT):
+        algorithm, _, options = spec.partition(":")
+        options = dict(option.split("=", 1) for option in options.split(",") if option)
+
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm {algorithm!r}, expected one of {', '.join(ALGORITHMS)}")
+        if set(options) - {"depth", "time", "positional"}:
+            raise ValueError(f"Unknown options {', '.join(sorted(set(options) - {'depth', 'time', 'positional'}))} in {spec!r}")
+
+        self.spec = spec
+        self.algorithm = algorithm
+        self.depth = int(options.get("depth", depth))
+        self.time_limit = float(options["time"]) if "time" in options else time_limit
+        self.positionalWeight = float(options.get("positional", AI.positionalWeight))
+        self.transpositionTable = None
+
+    def getMove(self, game_state):
+        """The move to play, as (start, end), and the number of nodes searched for it."""
+
+        AI.positionalWeight = self.positionalWeight
+        AI.searchStats = AI.SearchStats()
+
+        if self.algorithm == "alphabeta":
+            if self.transpositionTable is None:
+                self.transpositionTable = AI.TranspositionTable()
+
+            AI.transpositionTable = self.transpositionTable
+            move, stats = AI.searchPosition(game_state, self.time_limit, self.depth)
+        elif self.algorithm in ("negamax", "minmax"):
+            AI.bestMove, AI.rootDepth = None, self.depth
+
+            if self.algorithm == "negamax":
+                AI.negaMax(game_state, self.depth, 1 if game_state.whiteToMove else -1)
+            else:
+                AI.minMax(game_state, self.depth, game_state.whiteToMove)
+
+            move = AI.bestMove
+        elif self.algorithm == "greedy":
+            move = AI.greedyMove(game_state)
+        else:
+            move = None
+
+        if move is None:
+            move = AI.randomMove(game_state.getValidMoves())
+
+        return move, AI.searchStats.nodes
+
+
+def getResult(game_state):
+    """(result, reason) if the game is over, e.g. ("1/2-1/2", "threefold repetition"), or None. getValidMoves has to have been called."""
+
+    if game_state.checkmate:
+        return ("0-1" if game_state.whiteToMove else "1-0"), "checkmate"
+    if game_state.stalemate:
+        return "1/2-1/2", "stalemate"
+    if game_state.halfmoveClock >= FIFTY_MOVE_PLIES:
+        return "1/2-1/2", "fifty-move rule"
+    if game_state.isRepetition():
+        return "1/2-1/2", "threefold repetition"
+    if game_state.isInsufficientMaterial():
+        return "1/2-1/2", "insufficient material"
+
+    return None
+
+
+def playGame(white, black, opening, seed, depth=AI.MAX_DEPTH, time_limit=AI.TIME_LIMIT, pgn=False):
+    """Worker task: play a game between two engine settings from the FEN opening.
+
+    Returns a dict with the result, the reason the game ended, and the moves made and nodes searched by white and by black, e.g. nodes["w"]."""
+
+    random.seed(seed)  # The shuffled move orders of the simpler algorithms
+
+    players = {"w": Player(white, depth, time_limit), "b": Player(black, depth, time_limit)}
+    game_state = Game.fromFen(opening)
+
+    moves, nodes = {"w": 0, "b": 0}, {"w": 0, "b": 0}
+
+    while True:
+        game_state.getValidMoves()
+        result = getResult(game_state)
+
+        if result is not None:
+            break
+
+        color = "w" if game_state.whiteToMove else "b"
+        move, moveNodes = players[color].getMove(game_state)
+
+        game_state.makeMove(Move(move[0], move[1], game_state.board))
+        moves[color] += 1
+        nodes[color] += moveNodes
+
+    game = {"result": result[0], "reason": result[1], "moves": moves, "nodes": nodes}
+
+    if pgn:
+        game["pgn"] = formatGame(game_state, {"Event": "Self-play match", "White": white, "Black": black, "Termination": result[1]}, result[0])
+
+    return game
+
+
+def randomOpening(rng, plies=OPENING_PLIES):
+    """FEN of a position reached with plies random moves from the starting position, where the game is not over yet."""
+
+    for _ in range(MAX_OPENING_ATTEMPTS):
+        game_state = Game()
+
+        for _ in range(plies):
+            moves = game_state.getMoveCodes()
+
+            if not moves:
+                break
+
+            game_state.makeMove(rng.choice(moves))
+
+        if game_state.getMoveCodes():
+            return game_state.toFen()
+
+    return START_FEN
+
+
+def readOpenings(path, plies=OPENING_PLIES):
+    """FENs of the openings of a file: the positions of an EPD or FEN file, or the positions after plies moves of the games of a PGN file."""
+
+    openings = []
+
+    with open(path, encoding="utf-8", errors="replace") as file:
+        if path.lower().endswith(".pgn"):
+            for game in readGames(file):
+                game.moves = game.moves[:plies]
+
+                try:
+                    openings.append(game.toGame().toFen())
+                except ValueError:  # Unknown notation, or an under-promotion
+                    continue
+        else:
+            for line in file:
+                position = parseLine(line)
+
+                if position is not None:
+                    openings.append(position[0])
+
+    return openings
+
+
+def eloDifference(wins, draws, losses):
+    """(Elo difference, margin of its 95% confidence interval) of the results, or (None, None) if they cannot give one."""
+
+    games = wins + draws + losses
+
+    score = (wins + draws / 2) / games if games else 0
+
+    if score in (0, 1):  # No games, or all of them won or lost: there is no finite estimate
+        return None, None
+
+    deviation = math.sqrt((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games)
+    margin = 1.96 * deviation / math.sqrt(games)
+
+    def elo(score):
+        score = min(max(score, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / score - 1)
+
+    return elo(score), (elo(score + margin) - elo(score - margin)) / 2
+
+
+def runMatch(first, second, games, openings=None, depth=AI.MAX_DEPTH, time_limit=AI.TIME_LIMIT, workers=None, seed=None, pgnFile=None, openingPlies=OPENING_PLIES):
+    """Play games between the engine settings first and second, and print the results from the point of view of first.
+
+    Openings are taken in turn from the list of FENs given, or made up with openingPlies random moves. Returns (wins, draws, losses) of first."""
+
+    rng = random.Random(seed)
+    workers = workers or multiprocessing.cpu_count()
+
+    wins = draws = losses = 0
+    reasons = {}
+    moves, nodes = [0, 0], [0, 0]  # Of first and of second
+
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {}
+
+        for index in range((games + 1) // 2):
+            opening = openings[index % len(openings)] if openings else randomOpening(rng, openingPlies)
+            gameSeed = rng.getrandbits(32)
+
+            for white, black in ((first, second), (second, first))[:games - 2 * index]:
+                future = pool.submit(playGame, white, black, opening, gameSeed, depth, time_limit, pgnFile is not None)
+                futures[future] = white == first
+
+        for played, future in enumerate(as_completed(futures), 1):
+            game = future.result()
+            firstIsWhite = futures[future]
+
+            if game["result"] == "1/2-1/2":
+                draws += 1
+            elif (game["result"] == "1-0") == firstIsWhite:
+                wins += 1
+            else:
+                losses += 1
+
+            reasons[game["reason"]] = reasons.get(game["reason"], 0) + 1
+
+            for color, player in (("w", 0 if firstIsWhite else 1), ("b", 1 if firstIsWhite else 0)):
+                moves[player] += game["moves"][color]
+                nodes[player] += game["nodes"][color]
+
+            if pgnFile is not None:
+                pgnFile.write(game["pgn"] + "\n")
+
+            print(f"Game {played}/{games}: {first} {wins} - {losses} {second}, {draws} drawn", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    elo, margin = eloDifference(wins, draws, losses)
+
+    print(f"\n{first} vs {second}: {wins} wins, {draws} draws, {losses} losses in {games} games")
+    print(f"Score {(wins + draws / 2) / games:.1%}, " + (f"Elo difference {elo:+.0f} +/- {margin:.0f}" if elo is not None else "Elo difference not measurable"))
+    print(f"{games / elapsed:.2f} games/s over {workers} processes")
+
+    for player, spec in enumerate((first, second)):
+        print(f"{spec}: {nodes[player] / max(moves[player], 1):.0f} nodes per move")
+
+    print("Endings: " + ", ".join(f"{reason} {count}" for reason, count in sorted(reasons.items(), key=lambda item: -item[1])))
+
+    return wins, draws, losses
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Play a self-play match between two engine settings of AI.py.")
+    parser.add_argument("first", help='engine setting, e.g. "alphabeta:depth=3" or "greedy"')
+    parser.add_argument("second", help="engine setting to play against")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--openings", help="EPD, FEN or PGN file of openings, by default random ones")
+    parser.add_argument("--opening-plies", type=int, default=OPENING_PLIES, help="moves of each PGN game, or random moves, to start from")
+    parser.add_argument("--depth", type=int, default=3, help="search depth of settings that do not give one")
+    parser.add_argument("--time", type=float, default=None, help="seconds per move of alphabeta settings that do not give a time, by default no limit")
+    parser.add_argument("--workers", type=int, help="number of worker processes, by default one per core")
+    parser.add_argument("--seed", type=int, help="seed of the random openings")
+    parser.add_argument("--pgn", help="file to write the games to")
+    args = parser.parse_args()
+
+    try:
+        for spec in (args.first, args.second):
+            Player(spec)
+    except ValueError as error:
+        sys.exit(str(error))
+
+    openings = readOpenings(args.openings, args.opening_plies) if args.openings else None
+
+    if openings == []:
+        sys.exit(f"No openings in {args.openings}")
+
+    pgnFile = open(args.pgn, "w", encoding="utf-8") if args.pgn else None
+
+    try:
+        runMatch(args.first, args.second, args.games, openings, args.depth, args.time, args.workers, args.seed, pgnFile, args.opening_plies)
+    finally:
+        if pgnFile is not None:
+            pgnFile.close()
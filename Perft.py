@@ -0,0 +1,110 @@
+# Perft: count the leaf nodes of the move tree to a fixed depth. Checks Game's move generation against known node counts and measures its speed.
+# Runs without pygame, e.g. "python Perft.py" for the regression suite or "python Perft.py --fen <FEN> --depth 3 --divide".
+
+import sys
+import time
+from argparse import ArgumentParser
+from Engine import Game, decodeMove, squareName
+
+# (name, FEN, node count at depth 1, 2, ...). Game only promotes to queens, so these positions have no other promotion within the listed depths
+POSITIONS = (("Start position", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", (20, 400, 8902, 197281, 4865609)),
+             ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", (48, 2039, 97862)),
+             ("Rook endgame with en passant", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", (14, 191, 2812, 43238, 674624)),
+             ("Middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", (46, 2079, 89890, 3894594)),
+             ("Illegal en passant along a row", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", (18, 92, 1670, 10138, 185429)),
+             ("En passant gives check", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", (13, 102, 1266, 10276, 135655)),
+             ("Short castling gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", (15, 66, 1198, 6399, 120330)),
+             ("Long castling gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1", (16, 71, 1286, 7418, 141077)),
+             ("Castling rights lost", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1", (26, 1141, 27826, 1274206)),
+             ("Castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1", (44, 1494, 50509, 1720476)),
+             ("Discovered check", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", (37, 183, 6559, 23527, 811573)),
+             ("Stalemate and checkmate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", (2, 6, 13, 63)),
+             ("En passant captures a checking pawn", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", (15, 126, 1928, 13931)),
+             ("En passant exposes the king", "8/8/8/8/k2Pp2Q/8/8/3K4 b - d3 0 1", (6, 136, 863, 20471)),
+             ("En passant along a diagonal pin", "8/5bk1/8/2Pp4/8/1K6/8/8 w - d6 0 1", (8, 104, 736, 9287)),
+             ("En passant after the opening", "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3", (31, 707, 21637, 524138)))
+
+MAX_NODES = 250000  # The suite skips depths with more nodes than this, unless told otherwise
+
+
+def perft(game_state, depth):
+    if depth == 0:
+        return 1
+
+    nodes = 0
+
+    for move in game_state.getMoveCodes():
+        game_state.makeMove(move)
+        nodes += perft(game_state, depth - 1)
+        game_state.undoMove()
+
+    return nodes
+
+
+def divide(game_state, depth):
+    """Perft of every move at the root, as {(start, end): nodes}."""
+
+    counts = {}
+
+    for move in game_state.getMoveCodes():
+        game_state.makeMove(move)
+        counts[decodeMove(move)] = perft(game_state, depth - 1)
+        game_state.undoMove()
+
+    return counts
+
+
+def timedPerft(game_state, depth):
+    """Returns (nodes, seconds, nodes per second)."""
+
+    start = time.perf_counter()
+    nodes = perft(game_state, depth)
+    elapsed = time.perf_counter() - start
+
+    return nodes, elapsed, nodes / elapsed if elapsed else 0.0
+
+
+def runSuite(maxNodes=MAX_NODES):
+    """Run every position of POSITIONS to each depth with at most maxNodes nodes. Returns True if all node counts match."""
+
+    passed = True
+    totalNodes = totalTime = 0
+
+    for name, fen, counts in POSITIONS:
+        for depth, expected in enumerate(counts, 1):
+            if expected > maxNodes:
+                break
+
+            nodes, elapsed, nps = timedPerft(Game.fromFen(fen), depth)
+            totalNodes += nodes
+            totalTime += elapsed
+
+            status = "ok" if nodes == expected else f"FAILED, expected {expected}"
+            passed = passed and nodes == expected
+
+            print(f"{name:32} depth {depth}  {nodes:>9} nodes  {elapsed:8.3f} s  {nps:>9.0f} nodes/s  {status}")
+
+    print(f"\nTotal: {totalNodes} nodes in {totalTime:.3f} s, {totalNodes / totalTime:.0f} nodes/s")
+
+    return passed
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Perft node counts and move generation speed of Engine.Game.")
+    parser.add_argument("--fen", help="position to count, instead of running the regression suite")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--max-nodes", type=int, default=MAX_NODES, help="largest node count the suite runs")
+    args = parser.parse_args()
+
+    if args.fen is None:
+        sys.exit(0 if runSuite(args.max_nodes) else 1)
+
+    game_state = Game.fromFen(args.fen)
+
+    if args.divide:
+        for (start, end), nodes in divide(game_state, args.depth).items():
+            print(f"{squareName(start)}{squareName(end)}: {nodes}")
+
+    nodes, elapsed, nps = timedPerft(game_state, args.depth)
+    print(f"\nNodes: {nodes}  Time: {elapsed:.3f} s  Nodes/s: {nps:.0f}")
@@ -0,0 +1,160 @@
+# PGN import and export for Engine.Game.
+# readGames streams the games of a PGN file one at a time, so files of any size can be read without loading them whole.
+
+import re
+from copy import deepcopy
+from Engine import Game, START_FEN
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+
+LINE_LENGTH = 80  # PGN export lines may not be longer than this
+
+_tagPattern = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_tokenPattern = re.compile(r"\s*([{}();]|[^\s{}();]+)")
+_moveNumberPattern = re.compile(r"^(\d+\.+|\d+$)")  # With its dots, so that castling written with zeros, "0-0", is kept
+
+
+class PgnGame:
+    """A game as read from PGN: its tags, e.g. tags["White"], its moves in standard algebraic notation, and its result."""
+
+    def __init__(self, tags=None, moves=None, result="*"):
+        self.tags = tags if tags is not None else {}
+        self.moves = moves if moves is not None else []
+        self.result = result
+
+    def toGame(self):
+        """A Game with the moves played from the starting position, or from the FEN tag. Raises ValueError for an invalid move."""
+
+        game_state = Game.fromFen(self.tags["FEN"]) if "FEN" in self.tags else Game()
+
+        for san in self.moves:
+            game_state.makeMove(game_state.parseSan(san))
+
+        return game_state
+
+
+def readGames(file):
+    """Yield the games of an open PGN file as PgnGames, reading it line by line. Comments, variations and numeric annotations are skipped."""
+
+    game = PgnGame()
+    inComment = False
+    variationDepth = 0
+
+    for line in file:
+        if line.startswith("%"):  # Escaped line
+            continue
+
+        if not inComment and not variationDepth and line.lstrip().startswith("["):
+            tag = _tagPattern.match(line.strip())
+
+            if tag:
+                if game.moves:  # A game without a result ends where the next one starts
+                    yield game
+                    game = PgnGame()
+
+                game.tags[tag.group(1)] = tag.group(2).replace('\\"', '"').replace("\\\\", "\\")
+                continue
+
+        position = 0
+
+        while position < len(line):
+            if inComment:
+                end = line.find("}", position)
+
+                if end < 0:
+                    break
+
+                inComment = False
+                position = end + 1
+                continue
+
+            match = _tokenPattern.match(line, position)
+
+            if not match:
+                break
+
+            token = match.group(1)
+            position = match.end()
+
+            if token == "{":
+                inComment = True
+            elif token == ";":  # Comment to the end of the line
+                break
+            elif token == "(":
+                variationDepth += 1
+            elif token == ")":
+                variationDepth = max(0, variationDepth - 1)
+            elif variationDepth or token.startswith("$") or not token.strip("!?"):  # Numeric annotations, and "!" or "?" set apart from their move
+                continue
+            elif token in RESULTS:
+                game.result = token
+                yield game
+                game = PgnGame()
+            else:
+                token = _moveNumberPattern.sub("", token)
+
+                if token:
+                    game.moves.append(token)
+
+    if game.moves or game.tags:
+        game.result = game.tags.get("Result", game.result)
+        yield game
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def formatGame(game_state, tags=None, result="*"):
+    """The moves played in game_state as a PGN game, with the Seven Tag Roster and any other tags given. A game that did not start from the starting position gets a FEN tag."""
+
+    # Take back every move on a copy, to find the starting position and to replay the moves from it
+    replay = deepcopy(game_state)
+    moves = []
+
+    while replay.moveLog:
+        moves.append(replay.moveLog[-1].code)
+        replay.undoMove()
+
+    moves.reverse()
+
+    tags = {**{name: "?" for name in SEVEN_TAG_ROSTER}, **(tags or {}), "Result": result}
+    startFen = replay.toFen()
+
+    if startFen != START_FEN:
+        tags["SetUp"], tags["FEN"] = "1", startFen
+
+    lines = [f'[{name} "{_escape(str(value))}"]' for name, value in tags.items()]
+    lines.append("")
+
+    tokens = []
+
+    for index, move in enumerate(moves):
+        if replay.whiteToMove:
+            tokens.append(f"{replay.fullmoveNumber}.")
+        elif index == 0:
+            tokens.append(f"{replay.fullmoveNumber}...")
+
+        tokens.append(replay.toSan(move))
+        replay.makeMove(move)
+
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+
+    return "\n".join(lines) + "\n"
+
+
+def writeGame(file, game_state, tags=None, result="*"):
+    """Append the game to an open PGN file, see formatGame."""
+
+    file.write(formatGame(game_state, tags, result) + "\n")
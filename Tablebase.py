@@ -0,0 +1,285 @@
+# Endgame tablebases: the exact result, and the distance to mate, of every position of a king and one piece against a lone king.
+# Built by retrograde analysis into TABLEBASE_DIR with "python Tablebase.py", or e.g. "python Tablebase.py KRK KPK" for some tables only.
+# The search probes them through Tablebases, which memory-maps the files read-only, so engine processes share a single copy.
+
+import mmap
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from array import array
+from Engine import BETWEEN_MASKS, KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+TABLEBASES = ("KQK", "KRK", "KPK")  # Material signatures built by default: the strong side's king and piece, then the lone king
+
+# Values are signed bytes from the point of view of the side to move. n > 0: mates in n plies, n < 0: is mated in -n - 1 plies, 0: draw
+DRAW = 0
+MAX_PLIES = 127
+
+# Tables are built with the strong side moving up the board, like white. Positions are indexed by the squares of the strong king, the lone king and the piece
+POSITIONS = 64 * 64 * 64
+
+# A table file only holds the positions that are not mirror images of others: with the strong king in this triangle, or with a pawn on files a to d
+TRIANGLE = tuple(row * 8 + col for row in range(4) for col in range(row, 4))
+PAWN_SQUARES = tuple(row * 8 + col for row in range(1, 7) for col in range(4))
+TRIANGLE_INDEX = {square: index for index, square in enumerate(TRIANGLE)}
+PAWN_INDEX = {square: index for index, square in enumerate(PAWN_SQUARES)}
+
+KING_TARGETS = tuple(tuple(target for target in range(64) if KING_ATTACKS[square] >> target & 1) for square in range(64))
+
+
+def _attacks(piece, square, target, occupied):
+    """Whether the strong side's piece on square attacks target, with the other pieces on the occupied bitboard."""
+
+    if piece == "N":
+        return KNIGHT_ATTACKS[square] >> target & 1
+    if piece == "P":
+        return PAWN_ATTACKS["w"][square] >> target & 1
+
+    rowDiff, colDiff = (target >> 3) - (square >> 3), (target & 7) - (square & 7)
+
+    if (piece != "B" and (rowDiff == 0 or colDiff == 0)) or (piece != "R" and abs(rowDiff) == abs(colDiff)):
+        return square != target and not BETWEEN_MASKS[square][target] & occupied
+
+    return False
+
+
+# Squares each piece attacks on an empty board. Apart from pawns, a piece may only have come from a square it attacks
+_reach = {piece: tuple(tuple(target for target in range(64) if _attacks(piece, square, target, 0)) for square in range(64)) for piece in "QRBN"}
+
+
+def _pieceOrigins(piece, square, occupied):
+    """Squares the strong side's piece on square can have come from with a move that did not capture."""
+
+    if piece == "P":
+        origins = []
+
+        if square >> 3 <= 5 and not occupied >> (square + 8) & 1:
+            origins.append(square + 8)
+
+            if square >> 3 == 4 and not occupied >> (square + 16) & 1:
+                origins.append(square + 16)
+
+        return origins
+
+    return [origin for origin in _reach[piece][square] if not occupied >> origin & 1 and not BETWEEN_MASKS[square][origin] & occupied]
+
+
+def generateTable(piece, promotionTable=None):
+    """Values of all positions of the strong king and piece against the lone king, as an array indexed by side * POSITIONS + (strong king << 12 | lone king << 6 | piece).
+
+    Side 0 is the strong side to move. Illegal positions are left as draws. Pawns promote to a queen, so promotionTable has to be the generated KQK table for them."""
+
+    values = array("b", bytes(2 * POSITIONS))
+    done = bytearray(2 * POSITIONS)
+    counts = bytearray(POSITIONS)  # Moves of the lone king that have not been shown to lose yet
+    buckets = [[]]  # Positions to look at, by their distance to mate in plies
+
+    def push(distance, index):
+        if distance > MAX_PLIES:
+            raise ValueError(f"K{piece}K has a mate longer than {MAX_PLIES} plies")
+
+        while len(buckets) <= distance:
+            buckets.append([])
+
+        buckets[distance].append(index)
+
+    for wk in range(64):
+        for bk in range(64):
+            if wk == bk or KING_ATTACKS[wk] >> bk & 1:
+                continue
+
+            for p in range(64):
+                if p == wk or p == bk or (piece == "P" and p >> 3 in (0, 7)):
+                    continue
+
+                index = wk << 12 | bk << 6 | p
+                inCheck = _attacks(piece, p, bk, 1 << wk)
+
+                if inCheck:  # The strong side cannot be the one to move
+                    done[index] = 1
+
+                moves, escape = 0, False
+
+                for target in KING_TARGETS[bk]:
+                    if target == wk or KING_ATTACKS[wk] >> target & 1:
+                        continue
+
+                    if target == p:  # The piece is not protected, so capturing it draws
+                        escape = True
+                    elif not _attacks(piece, p, target, 1 << wk):
+                        moves += 1
+
+                if escape or not moves:
+                    done[POSITIONS + index] = 1
+
+                    if inCheck and not escape and not moves:
+                        values[POSITIONS + index] = -1
+                        push(0, POSITIONS + index)
+                else:
+                    counts[index] = moves
+
+                # A pawn that promotes wins if the lone king loses the resulting KQK position
+                if piece == "P" and p >> 3 == 1 and not done[index] and p - 8 != wk and p - 8 != bk:
+                    value = promotionTable[POSITIONS + (wk << 12 | bk << 6 | (p - 8))]
+
+                    if value < 0 and (not values[index] or -value < values[index]):
+                        values[index] = -value
+                        push(-value, index)
+
+    distance = 0
+
+    while distance < len(buckets):
+        for index in buckets[distance]:
+            if index >= POSITIONS:  # The lone king to move loses: every move into it wins for the strong side
+                wk, bk, p = index >> 12 & 63, index >> 6 & 63, index & 63
+
+                predecessors = [origin << 12 | bk << 6 | p for origin in KING_TARGETS[wk] if origin != bk and origin != p and not KING_ATTACKS[bk] >> origin & 1]
+                predecessors += [wk << 12 | bk << 6 | origin for origin in _pieceOrigins(piece, p, 1 << wk | 1 << bk)]
+
+                for predecessor in predecessors:
+                    if not done[predecessor] and (not values[predecessor] or distance + 1 < values[predecessor]):
+                        values[predecessor] = distance + 1
+                        push(distance + 1, predecessor)
+
+            elif not done[index] and values[index] == distance:  # The strong side to move wins, and no shorter mate was found before
+                done[index] = 1
+                wk, bk, p = index >> 12 & 63, index >> 6 & 63, index & 63
+
+                for origin in KING_TARGETS[bk]:
+                    if origin == wk or origin == p or KING_ATTACKS[wk] >> origin & 1:
+                        continue
+
+                    predecessor = wk << 12 | origin << 6 | p
+
+                    if not done[POSITIONS + predecessor]:
+                        counts[predecessor] -= 1
+
+                        if not counts[predecessor]:  # Every move of the lone king loses
+                            done[POSITIONS + predecessor] = 1
+                            values[POSITIONS + predecessor] = -(distance + 2)
+                            push(distance + 1, POSITIONS + predecessor)
+
+        distance += 1
+
+    return values
+
+
+def tableIndex(piece, strongToMove, wk, bk, p):
+    """Index into a table file of the position, given with the strong side moving up the board. The position is mirrored as needed."""
+
+    if piece == "P":
+        if p & 7 > 3:
+            wk, bk, p = wk ^ 7, bk ^ 7, p ^ 7
+
+        return ((0 if strongToMove else 64) + wk << 6 | bk) * len(PAWN_SQUARES) + PAWN_INDEX[p]
+
+    if wk & 7 > 3:
+        wk, bk, p = wk ^ 7, bk ^ 7, p ^ 7
+    if wk >> 3 > 3:
+        wk, bk, p = wk ^ 56, bk ^ 56, p ^ 56
+    if wk >> 3 > wk & 7:  # Mirror along the a8-h1 diagonal
+        wk, bk, p = (wk & 7) << 3 | wk >> 3, (bk & 7) << 3 | bk >> 3, (p & 7) << 3 | p >> 3
+
+    return ((0 if strongToMove else len(TRIANGLE)) + TRIANGLE_INDEX[wk] << 12) | bk << 6 | p
+
+
+def compactTable(piece, values):
+    """The bytes of the table file: the values of generateTable in the order of tableIndex."""
+
+    data = bytearray()
+
+    for side in (0, 1):
+        if piece == "P":
+            for wk in range(64):
+                for bk in range(64):
+                    data.extend(values[side * POSITIONS + (wk << 12 | bk << 6 | p)] & 0xFF for p in PAWN_SQUARES)
+        else:
+            for wk in TRIANGLE:
+                for bk in range(64):
+                    data.extend(values[side * POSITIONS + (wk << 12 | bk << 6 | p)] & 0xFF for p in range(64))
+
+    return bytes(data)
+
+
+def buildTablebases(signatures=TABLEBASES, directory=TABLEBASE_DIR):
+    """Generate the tables of the given material signatures, e.g. "KQK", into directory. KQK is also built when KPK is asked for."""
+
+    os.makedirs(directory, exist_ok=True)
+
+    if "KPK" in signatures and "KQK" not in signatures:
+        signatures = ("KQK",) + tuple(signatures)
+
+    generated = {}
+
+    for signature in sorted(signatures, key=lambda signature: signature == "KPK"):  # KPK needs KQK for its promotions
+        if len(signature) != 3 or signature[0] != "K" or signature[2] != "K" or signature[1] not in "QRBNP":
+            raise ValueError(f"Unsupported material signature {signature}, only a king and one piece against a king are")
+
+        start = time.perf_counter()
+        generated[signature] = generateTable(signature[1], generated.get("KQK"))
+
+        with open(os.path.join(directory, signature + ".tb"), "wb") as file:
+            file.write(compactTable(signature[1], generated[signature]))
+
+        longest = max(generated[signature])
+        print(f"{signature}: longest mate {longest} plies, generated in {time.perf_counter() - start:.1f} s")
+
+
+class Tablebases:
+    """The tables of a directory, opened when first needed. Missing tables are simply not probed."""
+
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.directory = directory
+        self.tables = {}
+
+    def getTable(self, signature):
+        if signature not in self.tables:
+            path = os.path.join(self.directory, signature + ".tb")
+            self.tables[signature] = None
+
+            if os.path.exists(path):
+                with open(path, "rb") as file:
+                    self.tables[signature] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return self.tables[signature]
+
+    def probe(self, game_state):
+        """Value of the position for the side to move, see DRAW, or None if there is no table for its material."""
+
+        bitboards = game_state.bitboards
+
+        if bin(game_state.occupancy["w"] | game_state.occupancy["b"]).count("1") != 3:
+            return None
+
+        strong = "w" if game_state.occupancy["w"] & (game_state.occupancy["w"] - 1) else "b"
+        piece = next(piece for piece in "QRBNP" if bitboards[strong + piece])
+
+        table = self.getTable("K" + piece + "K")
+
+        if table is None:
+            return None
+
+        wk = bitboards[strong + "K"].bit_length() - 1
+        bk = bitboards[("b" if strong == "w" else "w") + "K"].bit_length() - 1
+        p = bitboards[strong + piece].bit_length() - 1
+
+        if strong == "b":
+            wk, bk, p = wk ^ 56, bk ^ 56, p ^ 56
+
+        value = table[tableIndex(piece, game_state.whiteToMove == (strong == "w"), wk, bk, p)]
+
+        return value - 256 if value > 127 else value
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Generate endgame tablebases for the search of AI.py.")
+    parser.add_argument("signatures", nargs="*", default=TABLEBASES, help=f"material signatures to generate, by default {' '.join(TABLEBASES)}")
+    parser.add_argument("--directory", default=TABLEBASE_DIR)
+    args = parser.parse_args()
+
+    try:
+        buildTablebases(args.signatures, args.directory)
+    except ValueError as error:
+        sys.exit(str(error))
@@ -0,0 +1,234 @@
+# UCI front-end: speaks the Universal Chess Interface over standard input and output, so that chess GUIs and match tools can run the engine.
+# Runs without pygame, e.g. "python Uci.py". The search runs on a thread of its own, so "stop" and "isready" are answered while it thinks.
+
+import sys
+import threading
+import AI
+from Engine import Game, encodeMove, moveToUci
+
+ENGINE_NAME = "ChessAI"
+ENGINE_AUTHOR = "Khush24Shah"
+
+MOVES_TO_GO = 30  # Moves the remaining time is shared over when the GUI does not say
+MOVE_OVERHEAD = 0.05  # Seconds kept back on every move for the communication with the GUI
+MAX_SEARCH_DEPTH = AI.MAX_PLY // 2  # Depth searched to when only time, nodes or a stop command limit the search
+
+GO_LIMITS = ("depth", "movetime", "nodes", "wtime", "btime", "winc", "binc", "movestogo")
+
+
+def formatScore(score):
+    """The score of the side to move as UCI gives it, e.g. "cp 35" in centipawns or "mate -2" in moves."""
+
+    if abs(score) > AI.CHECKMATE - AI.MATE_SCORES:  # CHECKMATE - n for a mate in n plies
+        moves = max(1, int(AI.CHECKMATE - abs(score) + 1) // 2)
+        return f"mate {moves if score > 0 else -moves}"
+
+    return f"cp {round(score * 100)}"
+
+
+def allocateTime(limits, whiteToMove):
+    """Seconds to search for, from the limits of a go command, or None if they set no time limit."""
+
+    if "movetime" in limits:
+        return max(limits["movetime"] / 1000 - MOVE_OVERHEAD, 0)
+
+    remaining = limits.get("wtime" if whiteToMove else "btime")
+
+    if remaining is None:
+        return None
+
+    increment = limits.get("winc" if whiteToMove else "binc", 0)
+    budget = min(remaining / max(limits.get("movestogo", MOVES_TO_GO), 1) + increment, remaining / 2)
+
+    return max(budget / 1000 - MOVE_OVERHEAD, 0)
+
+
+class UciEngine:
+    """The state of a UCI session: the current position, the options set by the GUI, and the search thread."""
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock()  # The search thread writes too
+
+        self.game_state = Game()
+        self.useBook = True
+
+        self.searchThread = None
+        self.released = threading.Event()  # Set by stop or ponderhit, before which infinite and ponder searches may not send their best move
+        self.ponderTime = None  # Seconds to search for after a ponderhit
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self, input=sys.stdin):
+        """Handle commands until "quit" or the end of input."""
+
+        for line in input:
+            if not self.handle(line):
+                break
+
+        self.stop()
+
+    def handle(self, line):
+        """Carry out a command line. Returns False for "quit"."""
+
+        tokens = line.split()
+
+        if not tokens:
+            return True
+
+        command, arguments = tokens[0], tokens[1:]
+
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send("option name OwnBook type check default true")
+            self.send("option name Ponder type check default false")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.setOption(arguments)
+        elif command == "ucinewgame":
+            self.stop()
+            AI.transpositionTable.clear()
+        elif command == "position":
+            self.stop()
+            self.setPosition(arguments)
+        elif command == "go":
+            self.stop()
+            self.go(arguments)
+        elif command == "stop":
+            self.stop()
+        elif command == "ponderhit":
+            self.ponderHit()
+        elif command == "quit":
+            return False
+        else:
+            self.send(f"info string Unknown command {command}")
+
+        return True
+
+    def setOption(self, arguments):
+        text = " ".join(arguments)
+        name, _, value = text.partition(" value ")
+        name = name.replace("name", "", 1).strip()
+
+        if name.lower() == "ownbook":
+            self.useBook = value.strip().lower() == "true"
+
+    def setPosition(self, arguments):
+        """position startpos|fen <FEN> [moves <move> ...]"""
+
+        if "moves" in arguments:
+            index = arguments.index("moves")
+            arguments, moves = arguments[:index], arguments[index + 1:]
+        else:
+            moves = []
+
+        try:
+            if arguments[:1] == ["fen"]:
+                game_state = Game.fromFen(" ".join(arguments[1:]))
+            elif arguments[:1] == ["startpos"]:
+                game_state = Game()
+            else:
+                raise ValueError("Expected startpos or fen")
+
+            for move in moves:
+                game_state.makeMove(game_state.parseUci(move))
+        except ValueError as error:
+            self.send(f"info string {error}")
+            return
+
+        self.game_state = game_state
+
+    def go(self, arguments):
+        """go [depth N] [movetime MS] [nodes N] [wtime MS] [btime MS] [winc MS] [binc MS] [movestogo N] [infinite] [ponder]"""
+
+        limits = {}
+
+        for name, value in zip(arguments, arguments[1:]):
+            if name in GO_LIMITS and value.lstrip("-").isdigit():
+                limits[name] = int(value)
+
+        ponder = "ponder" in arguments
+        infinite = "infinite" in arguments or not limits
+
+        time_limit = allocateTime(limits, self.game_state.whiteToMove)
+
+        if ponder:  # The clock only starts with ponderhit
+            self.ponderTime, time_limit = time_limit, None
+
+        self.released.clear()
+        AI.searchStop.clear()
+
+        self.searchThread = threading.Thread(target=self.search, args=(time_limit, min(max(limits.get("depth", MAX_SEARCH_DEPTH), 1), MAX_SEARCH_DEPTH), limits.get("nodes"), infinite or ponder), daemon=True)
+        self.searchThread.start()
+
+    def search(self, time_limit, max_depth, node_limit, waitForRelease):
+        """Body of the search thread: search the position and send info lines for every iteration, then the best move."""
+
+        game_state = self.game_state
+
+        def report(stats):
+            pv = " ".join(moveToUci(move) for move in stats.pv)
+
+            self.send(f"info depth {stats.depth} score {formatScore(stats.score)} nodes {stats.nodes} nps {int(stats.nodesPerSecond)} time {int(stats.elapsed * 1000)} pv {pv}".rstrip())
+
+        move, stats = AI.getBookMove(game_state) if self.useBook else None, None
+
+        if move is not None:
+            self.send("info string book move")
+        else:
+            move, stats = AI.searchPosition(game_state, time_limit, max_depth, node_limit, report)
+
+        if waitForRelease:
+            self.released.wait()
+
+        if move is None:
+            self.send("bestmove 0000")  # Checkmate or stalemate
+            return
+
+        code = encodeMove(move[0], move[1], game_state.board)
+        line = f"bestmove {moveToUci(code)}"
+
+        # The opponent's reply expected by the principal variation, or else by the transposition table
+        if stats is not None and len(stats.pv) > 1 and stats.pv[0] == code:
+            line += f" ponder {moveToUci(stats.pv[1])}"
+        else:
+            game_state.makeMove(code)
+            ponderMove = AI.getPonderMove(game_state)
+
+            if ponderMove is not None:
+                line += f" ponder {moveToUci(encodeMove(ponderMove[0], ponderMove[1], game_state.board))}"
+
+            game_state.undoMove()
+
+        self.send(line)
+
+    def ponderHit(self):
+        """The opponent played the expected move: the pondering search goes on, now with the time of the move."""
+
+        if self.ponderTime is not None:
+            AI.ponderHit(self.ponderTime)
+
+        self.ponderTime = None
+        self.released.set()
+
+    def stop(self):
+        """Stop the running search, if any, and wait for it to send its best move."""
+
+        if self.searchThread is None:
+            return
+
+        AI.searchStop.set()
+        self.released.set()
+
+        self.searchThread.join()
+        self.searchThread = None
+
+
+if __name__ == "__main__":
+    UciEngine().run()